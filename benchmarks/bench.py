@@ -0,0 +1,209 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Benchmark Galley's own overhead against a fake Docker daemon.
+
+    python benchmarks/bench.py --sizes 1,10,100,500 --save baseline.json
+    python benchmarks/bench.py --compare baseline.json
+
+Each benchmark is timed for synthetic configs of every size. With
+--compare, any result slower than the baseline by more than --tolerance is
+reported as a regression and the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import fakedaemon
+from galley import builder
+from galley import template
+
+
+def synthetic_config(size, daemons=()):
+    """A config with one pulled image and size resources using it.
+
+    Every resource after the first references the first one, so the
+    dependency graph is a star and the templates are exercised. If daemons
+    lists more than one URL, the resources are spread across them.
+    """
+    resources = {}
+    for n in range(size):
+        resources[n] = {
+            'name': 'resource%d' % n,
+            'image': '{{base}}',
+            'host_port': '{{auto_port}}',
+            'cont_port': 8000,
+            'warmup': 0,
+            'environment': {
+                'HOME': "{{environ['HOME']}}",
+                'INDEX': str(n),
+            },
+        }
+        if n:
+            resources[n]['environment']['UPSTREAM'] = (
+                "http://{{host['ip']}}:{{resources[0]['host_port']}}")
+    config = {
+        'images': {0: {'name': 'base', 'source': 'bench/base',
+                       'tag': 'latest', 'action': 'pull'}},
+        'resources': resources,
+        'testparams': {'home': "{{environ['HOME']}}"},
+    }
+    if len(daemons) > 1:
+        config['daemons'] = dict((n, {'url': url, 'memory': '16g',
+                                      'cpus': 8})
+                                 for n, url in enumerate(daemons))
+        for data in resources.values():
+            data['mem_limit'] = '256m'
+    return config
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence Galley's progress output while timing."""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def timed(func, *args, **kwargs):
+    started = time.time()
+    with quiet():
+        result = func(*args, **kwargs)
+    return time.time() - started, result
+
+
+def bench_size(size, concurrency, daemons=()):
+    """Return {benchmark name: seconds} for one config size."""
+    results = {}
+    for daemon in builder.DAEMONS.values():
+        daemon.state.loaded = False
+
+    config = synthetic_config(size, daemons)
+    results['render'], _ = timed(
+        template.render, config, {'environ': os.environ}, 'config')
+
+    # build_environment raises if any resource failed.
+    elapsed, environment = timed(builder.build_environment,
+                                 synthetic_config(size, daemons),
+                                 concurrency=concurrency)
+    if len(environment['resources']) != size:
+        raise Exception("Built %d of %d resources." %
+                        (len(environment['resources']), size))
+    results['build_environment'] = elapsed
+
+    placed = builder.configure_daemons(environment.get('daemons'))
+
+    def check_all():
+        for data in environment['resources'].values():
+            with builder.on_daemon(placed[data.get('daemon', 0)]):
+                builder.check_if_container_exists(data['container'])
+                builder.check_if_running(data['container'])
+                builder.check_if_image_exists('bench/base', 'latest')
+
+    results['existence_checks'], _ = timed(check_all)
+    results['clean'], failures = timed(builder.clean, environment, False,
+                                       concurrency=concurrency)
+    if failures:
+        raise Exception("Teardown at %d resources failed: %s" %
+                        (size, failures))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of every result slower than its baseline."""
+    regressions = []
+    for size, benches in sorted(results.items(), key=lambda r: int(r[0])):
+        for name, seconds in sorted(benches.items()):
+            before = baseline.get(size, {}).get(name)
+            if before and seconds > before * (1 + tolerance):
+                regressions.append("%s @ %s resources: %.4fs -> %.4fs "
+                                   "(+%.0f%%)" % (name, size, before,
+                                                  seconds,
+                                                  100 * (seconds / before -
+                                                         1)))
+    return regressions
+
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,10,100,500',
+                        help='Comma separated numbers of resources.')
+    parser.add_argument('--images', type=int, default=200,
+                        help='Unrelated images the fake daemon lists.')
+    parser.add_argument('--containers', type=int, default=300,
+                        help='Unrelated containers the fake daemon lists.')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='Seconds added to every fake API call.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--daemons', type=int, default=1,
+                        help='Fake daemons to spread resources across.')
+    parser.add_argument('--save', help='Write results as a baseline.')
+    parser.add_argument('--compare', help='Baseline to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown before a regression, as a '
+                             'fraction of the baseline.')
+    args = parser.parse_args(argv)
+
+    socket_dir = tempfile.mkdtemp(prefix='galley-bench-')
+    socket_paths = [os.path.join(socket_dir, 'docker%d.sock' % n)
+                    for n in range(max(1, args.daemons))]
+    latency = dict((route[3], args.latency) for route in fakedaemon.ROUTES)
+    servers = [fakedaemon.serve(path, images=args.images,
+                                containers=args.containers, latency=latency)
+               for path in socket_paths]
+    urls = ['unix://' + path for path in socket_paths]
+    os.environ['DOCKER_HOST'] = urls[0]
+
+    results = {}
+    try:
+        print("%-20s %8s %10s" % ('Benchmark', 'Size', 'Seconds'))
+        for size in [int(n) for n in args.sizes.split(',')]:
+            results[str(size)] = bench_size(size, args.concurrency, urls)
+            for name, seconds in sorted(results[str(size)].items()):
+                print("%-20s %8d %10.4f" % (name, size, seconds))
+    finally:
+        for server, path in zip(servers, socket_paths):
+            server.shutdown()
+            os.remove(path)
+        os.rmdir(socket_dir)
+
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump(results, outfile, indent=2, sort_keys=True)
+        print("\nSaved baseline to %s." % args.save)
+    if args.compare:
+        with open(args.compare) as infile:
+            regressions = compare(results, json.load(infile), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("\nNo regressions against %s." % args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""A stand-in Docker Engine API server for benchmarking Galley.
+
+It implements just enough of API v1.10 for Galley to pull, build, create,
+start, inspect, list and remove, and to follow the event stream. It keeps
+everything in memory and can add a fixed latency to every endpoint.
+"""
+
+import BaseHTTPServer
+import hashlib
+import itertools
+import json
+import os
+import Queue
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+
+PREFIX = re.compile(r'^/v[\d.]+')
+
+# (method, path pattern, handler name, latency key)
+ROUTES = [
+    ('GET', r'^/_ping$', 'ping', 'ping'),
+    ('GET', r'^/version$', 'version', 'version'),
+    ('GET', r'^/events$', 'events', 'events'),
+    ('GET', r'^/images/json$', 'list_images', 'images'),
+    ('POST', r'^/images/create$', 'pull', 'pull'),
+    ('GET', r'^/images/(?P<name>.+)/json$', 'inspect_image', 'inspect'),
+    ('DELETE', r'^/images/(?P<name>.+)$', 'remove_image', 'remove'),
+    ('POST', r'^/build$', 'build', 'build'),
+    ('GET', r'^/containers/json$', 'list_containers', 'containers'),
+    ('POST', r'^/containers/create$', 'create', 'create'),
+    ('GET', r'^/containers/(?P<name>[^/]+)/json$', 'inspect_container',
+     'inspect'),
+    ('POST', r'^/containers/(?P<name>[^/]+)/start$', 'start', 'start'),
+    ('POST', r'^/containers/(?P<name>[^/]+)/(?:kill|stop)$', 'kill', 'kill'),
+    ('POST', r'^/containers/(?P<name>[^/]+)/attach$', 'attach', 'logs'),
+    ('DELETE', r'^/containers/(?P<name>[^/]+)$', 'remove_container',
+     'remove'),
+]
+
+
+def _id(*parts):
+    return hashlib.sha256(':'.join(str(p) for p in parts)).hexdigest()
+
+
+class Daemon(object):
+    """In-memory images and containers behind the fake API."""
+
+    def __init__(self, images=0, containers=0):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.ports = itertools.count(49153)
+        self.images = {}
+        self.containers = {}
+        self.subscribers = []
+        for n in range(images):
+            self.add_image('filler/image%d:latest' % n)
+        for n in range(containers):
+            cont = self.add_container('filler/image%d:latest' %
+                                      (n % max(images, 1)))
+            cont['State']['Running'] = n % 2 == 0
+
+    def add_image(self, repo_tag):
+        with self.lock:
+            for image in self.images.values():
+                if repo_tag in image['RepoTags']:
+                    return image
+            image_id = _id('image', repo_tag, next(self.counter))
+            image = {'Id': image_id, 'RepoTags': [repo_tag],
+                     'Created': int(time.time()), 'Size': 0,
+                     'VirtualSize': 100 * 1024 * 1024}
+            self.images[image_id] = image
+            return image
+
+    def find_image(self, ref):
+        with self.lock:
+            for image in self.images.values():
+                if image['Id'].startswith(ref) or ref in image['RepoTags']:
+                    return image
+            for image in self.images.values():
+                if ref + ':latest' in image['RepoTags']:
+                    return image
+
+    def add_container(self, image, name=None):
+        with self.lock:
+            cont_id = _id('container', next(self.counter))
+            name = name or 'fake_%s' % cont_id[:8]
+            cont = {'Id': cont_id, 'Name': '/' + name, 'Image': image,
+                    'State': {'Running': False},
+                    'NetworkSettings': {'Ports': {}}}
+            self.containers[cont_id] = cont
+            return cont
+
+    def emit(self, status, cont):
+        event = {'status': status, 'id': cont['Id'], 'from': cont['Image'],
+                 'time': int(time.time())}
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+
+    def find_container(self, ref):
+        with self.lock:
+            for cont in self.containers.values():
+                if cont['Id'].startswith(ref) or cont['Name'] == '/' + ref:
+                    return cont
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return 'unix'
+
+    def _dispatch(self, method):
+        url = urlparse.urlparse(self.path)
+        path = PREFIX.sub('', url.path)
+        self.query = urlparse.parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else ''
+        for route_method, pattern, handler, latency in ROUTES:
+            match = re.match(pattern, path)
+            if route_method == method and match:
+                time.sleep(self.server.latency.get(latency, 0))
+                return getattr(self, handler)(**match.groupdict())
+        self._reply(404, {'message': 'No such endpoint'})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _reply(self, status, data=None, raw=None):
+        body = raw if raw is not None else (
+            json.dumps(data) if data is not None else '')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, status, messages):
+        """Reply with one chunk per message, as the daemon streams them."""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for message in messages:
+            self._chunk(message)
+        self.wfile.write('0\r\n\r\n')
+
+    def _chunk(self, message):
+        data = json.dumps(message) + '\r\n'
+        self.wfile.write('%x\r\n%s\r\n' % (len(data), data))
+
+    def _not_found(self, name):
+        self._reply(404, raw='No such image or container: %s' % name)
+
+    @property
+    def daemon(self):
+        return self.server.daemon
+
+    def ping(self):
+        self._reply(200, raw='OK')
+
+    def version(self):
+        self._reply(200, {'ApiVersion': '1.10', 'Version': '0.10.0'})
+
+    def events(self):
+        subscriber = Queue.Queue()
+        with self.daemon.lock:
+            self.daemon.subscribers.append(subscriber)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+        try:
+            while True:
+                self._chunk(subscriber.get())
+                self.wfile.flush()
+        except Exception:
+            pass
+        finally:
+            with self.daemon.lock:
+                self.daemon.subscribers.remove(subscriber)
+            self.close_connection = 1
+
+    def list_images(self):
+        with self.daemon.lock:
+            self._reply(200, self.daemon.images.values())
+
+    def pull(self):
+        repo = self.query['fromImage'][0]
+        tag = self.query.get('tag', ['latest'])[0]
+        self.daemon.add_image('%s:%s' % (repo, tag))
+        self._reply(200, raw=json.dumps({'status': 'Download complete'}))
+
+    def inspect_image(self, name):
+        image = self.daemon.find_image(name)
+        if not image:
+            return self._not_found(name)
+        self._reply(200, dict(image, id=image['Id']))
+
+    def remove_image(self, name):
+        image = self.daemon.find_image(name)
+        if not image:
+            return self._not_found(name)
+        with self.daemon.lock:
+            del self.daemon.images[image['Id']]
+        self._reply(200, [{'Deleted': image['Id']}])
+
+    def build(self):
+        tag = self.query.get('t', ['fake-build'])[0]
+        if ':' not in tag:
+            tag += ':latest'
+        image = self.daemon.add_image(tag)
+        self._stream(200, [
+            {'stream': 'Step 0 : FROM scratch\n'},
+            {'stream': 'Successfully built %s\n' % image['Id'][:12]}])
+
+    def list_containers(self):
+        show_all = self.query.get('all', ['0'])[0] in ('1', 'True', 'true')
+        with self.daemon.lock:
+            conts = [{'Id': c['Id'], 'Names': [c['Name']],
+                      'Image': c['Image'],
+                      'Status': 'Up 1 second' if c['State']['Running']
+                      else 'Exit 0'}
+                     for c in self.daemon.containers.values()
+                     if show_all or c['State']['Running']]
+        self._reply(200, conts)
+
+    def create(self):
+        spec = json.loads(self.body or '{}')
+        name = self.query.get('name', [None])[0]
+        cont = self.daemon.add_container(spec.get('Image'), name)
+        self.daemon.emit('create', cont)
+        self._reply(201, {'Id': cont['Id'], 'Warnings': None})
+
+    def inspect_container(self, name):
+        cont = self.daemon.find_container(name)
+        if not cont:
+            return self._not_found(name)
+        self._reply(200, cont)
+
+    def start(self, name):
+        cont = self.daemon.find_container(name)
+        if not cont:
+            return self._not_found(name)
+        spec = json.loads(self.body or '{}')
+        ports = {}
+        for port, bindings in (spec.get('PortBindings') or {}).items():
+            ports[port] = [{'HostIp': '0.0.0.0',
+                            'HostPort': b.get('HostPort') or
+                            str(next(self.daemon.ports))}
+                           for b in bindings]
+        cont['NetworkSettings']['Ports'] = ports
+        cont['State']['Running'] = True
+        self.daemon.emit('start', cont)
+        self._reply(204)
+
+    def kill(self, name):
+        cont = self.daemon.find_container(name)
+        if not cont:
+            return self._not_found(name)
+        cont['State']['Running'] = False
+        self.daemon.emit('die', cont)
+        self._reply(204)
+
+    def attach(self, name):
+        self._reply(200, raw='')
+
+    def remove_container(self, name):
+        cont = self.daemon.find_container(name)
+        if not cont:
+            return self._not_found(name)
+        if cont['State']['Running'] and \
+                self.query.get('force', ['0'])[0] not in ('1', 'True',
+                                                          'true'):
+            return self._reply(409, raw='Container is running')
+        with self.daemon.lock:
+            del self.daemon.containers[cont['Id']]
+        if cont['State']['Running']:
+            self.daemon.emit('die', cont)
+        self.daemon.emit('destroy', cont)
+        self._reply(204)
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+    # Galley opens many connections at once at the larger sizes.
+    request_queue_size = 128
+
+    def __init__(self, path, daemon, latency=None):
+        SocketServer.UnixStreamServer.__init__(self, path, Handler)
+        self.daemon = daemon
+        self.latency = latency or {}
+
+
+def serve(path, images=0, containers=0, latency=None):
+    """Start a fake daemon on a unix socket in a background thread.
+
+    latency maps a route's latency key (see ROUTES) to seconds. Returns
+    the server; call its shutdown() method to stop it.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    server = Server(path, Daemon(images, containers), latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -12,20 +12,38 @@
 #
 
 GALLEYENV = None
+# Names a file holding a pickled environment, for test worker processes.
+ENVIRONMENT_FILE = 'GALLEY_ENVIRONMENT_FILE'
 
-__all__ = ['__version__']
+__all__ = ['get_version']
 
-import pbr.version
+import cPickle as pickle
+import os
 
-version_info = pbr.version.VersionInfo('galley')
-try:
-    __version__ = version_info.version_string()
-except AttributeError:
-    __version__ = None
+VERSION = None
+
+
+def get_version():
+    """Return Galley's version string, or None if it is unknown.
+
+    pbr, which works it out, is slow to import, so it is only imported
+    when a version is asked for.
+    """
+    global VERSION
+    if VERSION is None:
+        import pbr.version
+        try:
+            VERSION = pbr.version.VersionInfo('galley').version_string()
+        except AttributeError:
+            pass
+    return VERSION
 
 
 def get_environment():
     global GALLEYENV
+    if GALLEYENV is None and os.environ.get(ENVIRONMENT_FILE):
+        with open(os.environ[ENVIRONMENT_FILE], 'rb') as infile:
+            GALLEYENV = pickle.load(infile)
     return GALLEYENV
 
 
@@ -0,0 +1,132 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Non-blocking versions of the builder operations.
+
+Each function starts its builder counterpart on a shared pool of workers
+and returns at once with a concurrent.futures.Future for its result, so a
+caller can start many operations and carry on with other work. Futures can
+be waited on with gather(), chained with add_done_callback(), or handed to
+an event loop with its wrap_future().
+"""
+
+import threading
+
+from concurrent import futures
+
+from galley import builder
+from galley import scheduler
+
+EXECUTOR = None
+EXECUTOR_LOCK = threading.Lock()
+
+
+def configure(max_workers=scheduler.DEFAULT_WORKERS):
+    """Replace the shared pool with one running max_workers operations.
+
+    The Docker client pools grow to match if they are smaller, so every
+    running operation has a connection. Operations already started are left
+    to finish.
+    """
+    global EXECUTOR
+    with EXECUTOR_LOCK:
+        previous = EXECUTOR
+        EXECUTOR = futures.ThreadPoolExecutor(max_workers=max_workers)
+        builder.reserve_clients(max_workers)
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return EXECUTOR
+
+
+def executor():
+    with EXECUTOR_LOCK:
+        if EXECUTOR is not None:
+            return EXECUTOR
+    return configure()
+
+
+def submit(func, *args, **kwargs):
+    """Run func(*args, **kwargs) on the shared pool; return its Future.
+
+    func talks to the daemon the caller is using (see builder.on_daemon).
+    """
+    daemon = builder.current_daemon()
+
+    def run():
+        with builder.on_daemon(daemon):
+            return func(*args, **kwargs)
+    return executor().submit(run)
+
+
+def gather(fs, timeout=None):
+    """Wait for futures and return their results in order.
+
+    Raises the first error in fs, after every future has finished.
+    """
+    fs = list(fs)
+    futures.wait(fs, timeout=timeout)
+    return [f.result(timeout=0) for f in fs]
+
+
+def pull(*args, **kwargs):
+    """Start builder.pull."""
+    return submit(builder.pull, *args, **kwargs)
+
+
+def build(*args, **kwargs):
+    """Start builder.build; the result is the ID of the built image."""
+    return submit(builder.build, *args, **kwargs)
+
+
+def create(*args, **kwargs):
+    """Start builder.create; the result is the new container's ID."""
+    return submit(builder.create, *args, **kwargs)
+
+
+def start(*args, **kwargs):
+    """Start builder.start."""
+    return submit(builder.start, *args, **kwargs)
+
+
+def stop(*args, **kwargs):
+    """Start builder.stop."""
+    return submit(builder.stop, *args, **kwargs)
+
+
+def kill(*args, **kwargs):
+    """Start builder.kill."""
+    return submit(builder.kill, *args, **kwargs)
+
+
+def remove_container(*args, **kwargs):
+    """Start builder.remove_container."""
+    return submit(builder.remove_container, *args, **kwargs)
+
+
+def remove_image(*args, **kwargs):
+    """Start builder.remove_image."""
+    return submit(builder.remove_image, *args, **kwargs)
+
+
+def build_environment(*args, **kwargs):
+    """Start builder.build_environment; the result is the environment.
+
+    The environment's own pulls, builds and resources run on its scheduler,
+    so this occupies a single worker of the shared pool.
+    """
+    return submit(builder.build_environment, *args, **kwargs)
+
+
+def clean(*args, **kwargs):
+    """Start builder.clean; the result lists any teardown failures."""
+    return submit(builder.clean, *args, **kwargs)
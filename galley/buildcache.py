@@ -0,0 +1,101 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import fnmatch
+import hashlib
+import json
+import os
+import threading
+
+from galley import fileutil
+
+
+CACHE_LOCK = threading.Lock()
+
+
+def cache_dir():
+    """Directory holding Galley's local caches."""
+    return os.environ.get('GALLEY_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.galley'))
+
+
+def index_path():
+    return os.path.join(cache_dir(), 'build-cache.json')
+
+
+def read_dockerignore(path):
+    """Return the exclude patterns from path/.dockerignore."""
+    patterns = []
+    try:
+        with open(os.path.join(path, '.dockerignore')) as infile:
+            for line in infile:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    patterns.append(line.rstrip('/'))
+    except IOError:
+        pass
+    return patterns
+
+
+def is_ignored(relpath, patterns):
+    """Check relpath, or any directory containing it, against patterns."""
+    parts = relpath.split(os.sep)
+    for i in range(1, len(parts) + 1):
+        candidate = '/'.join(parts[:i])
+        for pattern in patterns:
+            if fnmatch.fnmatch(candidate, pattern):
+                return True
+    return False
+
+
+def context_hash(path, options=None):
+    """Hash a build context the way the daemon would receive it.
+
+    Covers the relative path, mode and contents of every file that
+    .dockerignore does not exclude (the Dockerfile is always included),
+    plus any build options that change the result.
+    """
+    patterns = read_dockerignore(path)
+    digest = hashlib.sha256()
+    digest.update(json.dumps(options or {}, sort_keys=True))
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            fullpath = os.path.join(root, filename)
+            relpath = os.path.relpath(fullpath, path)
+            if relpath != 'Dockerfile' and is_ignored(relpath, patterns):
+                continue
+            digest.update(relpath + '\0')
+            digest.update(oct(os.lstat(fullpath).st_mode) + '\0')
+            if os.path.islink(fullpath):
+                digest.update(os.readlink(fullpath))
+            else:
+                with open(fullpath, 'rb') as infile:
+                    for block in iter(lambda: infile.read(65536), ''):
+                        digest.update(block)
+            digest.update('\0')
+    return digest.hexdigest()
+
+
+def lookup(digest):
+    """Return the image ID last built from a context hash, if any."""
+    with CACHE_LOCK:
+        return fileutil.read_json(index_path()).get(digest)
+
+
+def record(digest, image):
+    """Remember that a context hash built image."""
+    with CACHE_LOCK:
+        index = fileutil.read_json(index_path())
+        index[digest] = image
+        fileutil.write_json(index_path(), index)
@@ -11,27 +11,51 @@
 #   under the License.
 #
 
+import contextlib
+import copy
 import docker
+import hashlib
+import httplib
 import json
 import netifaces
 import os
+import Queue
 import re
-import socket
+import requests
 import subprocess
 import sys
+import threading
 import time
 import unittest
 import urllib2
-import yaml
 
 import galley
+from galley import buildcache
+from galley import buildlog
+from galley import configfile
+from galley import events
+from galley import logcapture
+from galley import ports
+from galley import probes
+from galley import runner
+from galley import scheduler
+from galley import snapshots
+from galley import specs
+from galley import state
+from galley import statefile
+from galley import template
+from galley import timing
+from galley import unixconn
 
 
-def connect(timeout=30):
-    """Creates a Docker Client Object to communicate with API."""
+def connect(timeout=30, base_url=None):
+    """Creates a Docker Client Object to communicate with API.
+
+    Talks to base_url if given, or else to DOCKER_HOST or the local socket.
+    """
     # For boot2docker and docker-osx compatibility.
-    if 'DOCKER_HOST' in os.environ.keys():
-        docker_host = os.environ['DOCKER_HOST']
+    if base_url or 'DOCKER_HOST' in os.environ.keys():
+        docker_host = base_url or os.environ['DOCKER_HOST']
         # docker-py does not support 'tcp://' as base_url; however,
         # the docker client does not support 'http://' for DOCKER_HOST.
         # So, we need to convert DOCKER_HOST for compatibility.
@@ -44,135 +68,507 @@ def connect(timeout=30):
     c = docker.Client(base_url=base_url,
                       version='1.10',
                       timeout=timeout)
+    if c.base_url.startswith('http+unix:'):
+        # Replace docker-py's adapter, which opens a socket per request.
+        c.mount('http+unix://', unixconn.UnixAdapter(c.base_url, timeout))
     return c
 
 
+class ClientPool(object):
+    """A thread-safe pool of Docker clients shared by a whole run.
+
+    Each client keeps its HTTP connection to the daemon alive between
+    requests, so borrowing one avoids a new socket and handshake per call.
+    At most size clients are created; further callers wait for one to be
+    returned.
+    """
+
+    def __init__(self, size=scheduler.DEFAULT_WORKERS, timeout=30,
+                 base_url=None):
+        self.size = size
+        self.timeout = timeout
+        self.base_url = base_url
+        self._clients = Queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        """Allow at least size clients."""
+        with self._lock:
+            self.size = max(self.size, size)
+
+    @contextlib.contextmanager
+    def client(self, timeout=None):
+        """Borrow a client, optionally with a per-operation timeout."""
+        try:
+            c = self._clients.get_nowait()
+        except Queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                c = connect(self.timeout, self.base_url)
+            else:
+                c = self._clients.get()
+        # docker-py reads the request timeout from the client for every
+        # call, so it can be overridden for the duration of one operation.
+        c._timeout = self.timeout if timeout is None else timeout
+        try:
+            yield c
+        finally:
+            c._timeout = self.timeout
+            self._clients.put(c)
+
+
+class Daemon(object):
+    """A Docker daemon that resources can be placed on.
+
+    Each daemon has its own client pool, snapshot and event subscription.
+    url is None for the daemon named by DOCKER_HOST, or the local socket.
+    memory (in bytes) and cpus are its capacity for placing resources, or
+    None if not declared.
+    """
+
+    def __init__(self, url=None, memory=None, cpus=None):
+        self.url = url
+        self.memory = memory
+        self.cpus = cpus
+        self.pool = ClientPool(size=CLIENT_POOL_SIZE, timeout=CLIENT_TIMEOUT,
+                               base_url=url)
+        self.state = state.DaemonState()
+        self.watcher = None
+        self.lock = threading.Lock()
+        self._ip = None
+
+    def __str__(self):
+        return self.url or os.environ.get('DOCKER_HOST', 'local daemon')
+
+    @property
+    def ip(self):
+        """The address resources started on this daemon are reached at."""
+        if self._ip is None:
+            self._ip = get_ip_address(self.url)
+        return self._ip
+
+
+CLIENT_POOL_SIZE = scheduler.DEFAULT_WORKERS
+CLIENT_TIMEOUT = 30
+
+# Every daemon used so far, by URL.
+DAEMONS = {}
+DAEMONS_LOCK = threading.Lock()
+
+# Which daemon each thread's operations go to; see on_daemon.
+_CONTEXT = threading.local()
+
+
+def get_daemon(url=None, memory=None, cpus=None):
+    """Return the Daemon for url, registering it on first use."""
+    with DAEMONS_LOCK:
+        daemon = DAEMONS.get(url)
+        if daemon is None:
+            daemon = DAEMONS[url] = Daemon(url)
+        if memory is not None:
+            daemon.memory = specs.parse_size(memory)
+        if cpus is not None:
+            daemon.cpus = float(cpus)
+        return daemon
+
+
+def configure_daemons(daemons=None):
+    """Return the Daemons listed in a config's daemons section.
+
+    The section maps indexes to entries with a url and optional memory
+    and cpus, like the images and resources sections; a plain list works
+    too. Without one, there is just the default daemon.
+    """
+    if not daemons:
+        return [DEFAULT_DAEMON]
+    if isinstance(daemons, dict):
+        daemons = [daemons[key] for key in sorted(daemons)]
+    return [get_daemon(entry['url'], entry.get('memory'), entry.get('cpus'))
+            for entry in daemons]
+
+
+def current_daemon():
+    """Return the daemon this thread's operations talk to."""
+    return getattr(_CONTEXT, 'daemon', None) or DEFAULT_DAEMON
+
+
+@contextlib.contextmanager
+def on_daemon(daemon):
+    """Send this thread's operations to daemon within the block.
+
+    Threads do not inherit the setting, so work handed to a pool has to
+    set it again.
+    """
+    previous = getattr(_CONTEXT, 'daemon', None)
+    _CONTEXT.daemon = daemon
+    try:
+        yield daemon
+    finally:
+        _CONTEXT.daemon = previous
+
+
+def configure_clients(size=scheduler.DEFAULT_WORKERS, timeout=30):
+    """Give every daemon a new client pool of the given size."""
+    global CLIENT_POOL_SIZE, CLIENT_TIMEOUT
+    with DAEMONS_LOCK:
+        CLIENT_POOL_SIZE = size
+        CLIENT_TIMEOUT = timeout
+        for daemon in DAEMONS.values():
+            daemon.pool = ClientPool(size=size, timeout=timeout,
+                                     base_url=daemon.url)
+
+
+def reserve_clients(size):
+    """Let every daemon's client pool hold at least size clients.
+
+    Pools only grow, and keep the clients they have, so environments and
+    aio operations running at the same time never shrink or replace each
+    other's pools.
+    """
+    global CLIENT_POOL_SIZE
+    with DAEMONS_LOCK:
+        CLIENT_POOL_SIZE = max(CLIENT_POOL_SIZE, size)
+        for daemon in DAEMONS.values():
+            daemon.pool.reserve(size)
+
+
+def client(timeout=None):
+    """Borrow a Docker client from the current daemon's pool."""
+    return current_daemon().pool.client(timeout)
+
+
+DEFAULT_DAEMON = get_daemon()
+
+# Seconds to wait for the daemon to report a container state change.
+STATE_TIMEOUT = 10
+
+
+def daemon_state():
+    """Return the current daemon's snapshot, loading it on first use."""
+    snapshot = current_daemon().state
+    if not snapshot.loaded:
+        refresh_state()
+    return snapshot
+
+
+def refresh_state():
+    """Reload the daemon snapshot with one image and one container listing.
+
+    Called once at the start of each phase; operations keep it current
+    in between.
+    """
+    with client() as c:
+        images = c.images()
+        # Without trunc=False, Docker-py lists short container IDs.
+        containers = c.containers(all=True, trunc=False)
+    snapshot = current_daemon().state
+    snapshot.load(images, containers)
+    return snapshot
+
+
+def watch_events():
+    """Keep the daemon snapshot current from the daemon's event stream.
+
+    Does nothing if a subscription is already live. Returns whether one
+    is; if the daemon cannot be subscribed to, state changes are checked
+    by asking it instead.
+    """
+    daemon = current_daemon()
+    with daemon.lock:
+        if daemon.watcher is None or not daemon.watcher.alive():
+            daemon.watcher = events.EventWatcher(
+                daemon.state,
+                lambda: connect(timeout=None, base_url=daemon.url))
+            if not daemon.watcher.start():
+                print("Unable to subscribe to Docker events from %s (%s). "
+                      "Polling for container state instead." %
+                      (daemon, daemon.watcher.error))
+        return daemon.watcher.alive()
+
+
+def stop_watching_events():
+    """End the event subscription of every daemon."""
+    with DAEMONS_LOCK:
+        daemons = list(DAEMONS.values())
+    for daemon in daemons:
+        with daemon.lock:
+            if daemon.watcher is not None:
+                daemon.watcher.stop()
+                daemon.watcher = None
+
+
+def wait_for_container(container, running=None, removed=False,
+                       timeout=STATE_TIMEOUT):
+    """Wait until a container is running, stopped or removed.
+
+    Waits on the snapshot while the event stream keeps it current, and
+    polls the daemon otherwise. Returns whether the container got there
+    within timeout seconds.
+    """
+    snapshot = current_daemon().state
+    if removed:
+        check = lambda: not snapshot.find_container(container)
+    else:
+        check = lambda: snapshot.is_running(container) == running
+    watcher = current_daemon().watcher
+    if watcher is not None and watcher.alive():
+        started = time.time()
+        snapshot.wait(lambda: check() or not watcher.alive(), timeout)
+        if watcher.alive():
+            if check():
+                return True
+            # An event may have been missed; ask the daemon before
+            # giving up.
+            inspect_container(container)
+            return check()
+        # The stream dropped; poll for the rest of the time.
+        timeout -= time.time() - started
+
+    def inspect_and_check():
+        inspect_container(container)
+        return check()
+    return probes.poll(inspect_and_check, timeout=timeout) is not None
+
+
+def inspect_container(container):
+    """Fetch one container's current state and record it in the snapshot.
+
+    Returns None if the container no longer exists.
+    """
+    try:
+        with client() as c:
+            info = c.inspect_container(container)
+    except docker.errors.APIError:
+        current_daemon().state.remove_container(container)
+        return None
+    current_daemon().state.add_container(info['Id'], [info.get('Name', '')],
+                                         running=info['State']['Running'])
+    return info
+
+
+def inspect_image(image):
+    """Fetch one image by ID or repo:tag and record it in the snapshot.
+
+    Returns None if the image does not exist.
+    """
+    try:
+        with client() as c:
+            info = c.inspect_image(image)
+    except docker.errors.APIError:
+        current_daemon().state.remove_image(image)
+        return None
+    repo_tags = [image] if ':' in image else []
+    current_daemon().state.add_image(info.get('Id', info.get('id')), repo_tags)
+    return info
+
+
+def is_running(container):
+    """Ask the daemon whether a container is running right now."""
+    info = inspect_container(container)
+    return bool(info and info['State']['Running'])
+
+
 def build(path=None, tag=None, quiet=False, fileobj=None, nocache=False,
-          rm=False, stream=False, timeout=600, retry=True):
-    """Build Docker image from Dockerfile in provided path."""
-    print("Building image %s with tag %s." % (path, tag))
-    c = connect(timeout)
-    #image, _ = c.build(path=path, tag=tag, quiet=quiet, fileobj=fileobj,
-    #                   nocache=nocache, rm=rm, stream=stream)
-    stream = c.build(path=path, tag=tag, quiet=quiet, fileobj=fileobj,
-                     nocache=nocache, rm=rm, stream=stream)
-    image = None
-    log = ''
-    for chunk in stream:
-        msg = json.loads(chunk)
-        stream = msg.get('stream')
-        error = msg.get('error')
-        if stream:
-            log += stream
-            if 'Successfully built' in stream:
-                image = stream.split(' ')[2].strip()
-        if error:
-            log += "ERROR: %s" % error
-    time.sleep(5)
-    if image:
-        if check_if_image_exists(image):
-            print("Successfully built image %s from %s." % (image, path))
-            return image
-        elif retry:
-            print("Image %s could not be found. Retrying build." % image)
-            build(path=path, tag=tag, quiet=quiet, fileobj=fileobj,
-                  nocache=nocache, rm=rm, stream=stream, retry=False)
+          rm=False, stream=False, timeout=600, retry=True, cache=False,
+          retries=2, backoff=2, progress=None):
+    """Build Docker image from Dockerfile in provided path.
+
+    With cache, the build is skipped if an image built from an identical
+    context still exists. A failed build is retried up to retries times
+    (none without retry), waiting backoff seconds before the first retry
+    and twice as long before each one after. progress, if given, is
+    called with each (event, text) pair parsed from the build output.
+    """
+    digest = None
+    if cache and path and not fileobj and not nocache:
+        options = {'tag': tag, 'rm': rm}
+        # Image IDs are only meaningful on the daemon that built them.
+        if current_daemon().url:
+            options['daemon'] = current_daemon().url
+        digest = buildcache.context_hash(path, options)
+        cached = buildcache.lookup(digest)
+        if cached and check_if_image_exists(cached):
+            print("Build context %s is unchanged. Using cached image %s." %
+                  (path, cached[:12]))
+            return cached
+
+    attempts = 1 + (retries if retry else 0)
+    delay = backoff
+    for attempt in range(1, attempts + 1):
+        print("Building image %s with tag %s." % (path, tag))
+        if fileobj and hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        log = buildlog.BuildLog(on_event=progress)
+        try:
+            with client(timeout) as c:
+                output = c.build(path=path, tag=tag, quiet=quiet,
+                                 fileobj=fileobj, nocache=nocache, rm=rm,
+                                 stream=stream)
+                for chunk in output:
+                    log.feed(chunk)
+        except (docker.errors.APIError, requests.RequestException,
+                httplib.HTTPException, IOError) as exc:
+            # The daemon refused the build or the connection dropped.
+            log.lines.append("ERROR: %s" % exc)
+            print("Build of %s failed: %s" % (path, exc))
+
+        if log.image and inspect_image(log.image):
+            print("Successfully built image %s from %s." % (log.image, path))
+            if digest:
+                buildcache.record(digest, log.image)
+            return log.image
+        if log.image:
+            print("Image %s could not be found." % log.image)
         else:
-            print("Failed building image. Image %s could \
-                  not be found." % image)
-            print("Build Output: \n")
-            sys.exit(1)
-    elif retry:
-        print("Failed building image from %s with tag %s. \
-              Retrying build." % (path, tag))
-        build(path=path, tag=tag, quiet=quiet, fileobj=fileobj,
-              nocache=nocache, rm=rm, stream=stream, retry=False)
-    else:
-        print("Failed building image from %s with tag %s." % (path, tag))
-        print("Build Output: \n")
-        print(log)
-        sys.exit(1)
+            print("Failed building image from %s with tag %s." % (path, tag))
+        if attempt < attempts:
+            print("Retrying build in %d seconds." % delay)
+            time.sleep(delay)
+            delay *= 2
+
+    print("Build Output: \n")
+    print(log.tail())
+    raise Exception("Failed building image from %s with tag %s." %
+                    (path, tag))
+
+
+def docker_command(*args):
+    """Return the argv to run a docker CLI command on the current daemon."""
+    docker_host = current_daemon().url or os.environ.get('DOCKER_HOST')
+    if docker_host:
+        return ['docker', '-H', docker_host] + list(args)
+    return ['docker'] + list(args)
 
 
 def check_if_container_exists(container):
     """Checks to see if Docker container exists."""
-    #c = connect()
     print("Checking if container %s exists." % container[:12])
-    # Docker-py currently does not properly list all containers
-    # even though it is documented. When/If it does, the
-    # following API call should work instead of the shell out.
-    # conts = c.containers(all=True)
-    if 'DOCKER_HOST' in os.environ.keys():
-        host = os.environ['DOCKER_HOST']
-        conts = subprocess.check_output(['docker', '-H', host, 'ps', '-a',
-                                        '--no-trunc=true'])
-    else:
-        conts = subprocess.check_output(['docker', 'ps', '-a',
-                                        '--no-trunc=true'])
-    for cont in conts.splitlines():
-        if container in cont:
-            return True
+    if daemon_state().find_container(container):
+        return True
 
 
 def check_if_image_exists(image, tag=None):
-    c = connect()
-    images = c.images()
+    state = daemon_state()
     if tag:
         print("Checking if image %s:%s exists." % (image, tag))
-        for i in images:
-            for repoTag in i['RepoTags']:
-                if image + ":" + tag in repoTag:
-                    print("Found image %s:%s." % (image, tag))
-                    return True
+        if state.find_image(image, tag):
+            print("Found image %s:%s." % (image, tag))
+            return True
     else:
         print("Checking if image %s exists." % image[:12])
-        for i in images:
-            # Force short hash because some Docker-Py functions
-            # return long hash, and some return short hash. :/
-            if image[:12] in i['Id']:
-                print("Found image %s." % image[:12])
-                return True
-            for repoTag in i['RepoTags']:
-                if image == repoTag:
-                    print("Found image %s." % image)
-                    return True
+        if state.find_image(image):
+            print("Found image %s." % image[:12])
+            return True
 
 
 def check_if_running(container):
-    c = connect()
-    conts = c.containers()
-    for cont in conts:
-        if container in cont['Id']:
-            return True
+    return daemon_state().is_running(container)
 
 
-def clean(environment, nodestroy):
+def clean(environment, nodestroy, concurrency=scheduler.DEFAULT_WORKERS):
     # Clean the house...
+    # Docker holds the ports of anything left running, so Galley's leases
+    # can go either way. Other environments keep theirs.
+    ports.release(environment.get('leased_ports', []))
     if not nodestroy:
-        for index, data in environment['resources'].iteritems():
-            kill(data['container'])
-            remove_container(data['container'])
+        daemons = configure_daemons(environment.get('daemons'))
+        containers = [{} for daemon in daemons]
+        for resources in environment.get('shards',
+                                         [environment['resources']]):
+            for index, data in resources.iteritems():
+                if data.get('container'):
+                    containers[data.get('daemon', 0)][data['container']] = \
+                        data['image']
+        images = [[] for daemon in daemons]
         for index, data in environment['images'].iteritems():
-            if 'persist' in data.keys():
-                if not data['persist']:
-                    remove_image(data['image'])
-            else:
-                remove_image(data['image'])
+            if not data.get('image'):
+                continue
+            if 'persist' in data.keys() and data['persist']:
+                continue
+            for d, image in (data.get('image_ids') or
+                             {0: data['image']}).items():
+                images[d].append(image)
+
+        def tear_down(d):
+            with on_daemon(daemons[d]):
+                return teardown(containers[d], images[d],
+                                concurrency=concurrency)
 
+        if len(daemons) == 1:
+            return tear_down(0)
+        results, errors = scheduler.run_graph(
+            dict((d, set()) for d in range(len(daemons))), tear_down,
+            max_workers=len(daemons), stop_on_error=False)
+        failures = [(str(daemons[d]), error) for d, error in errors.items()]
+        for d in sorted(results):
+            failures.extend(results[d])
+        return failures
+    return []
 
-def cleanup(containers=None, images=None):
+
+def cleanup(containers=None, images=None,
+            concurrency=scheduler.DEFAULT_WORKERS):
     """Remove Images and Containers from System."""
     print("Cleaning Up Environment:")
-    if containers:
-        print("Removing containers:")
-        for cont in containers:
-            kill(cont)
-            remove_container(cont)
-    if images:
-        print("Removing images:")
-        for image in images:
-            remove_image(image)
-    print("Cleanup Successful.")
+    # Without knowing which image each container uses, every image
+    # waits for every container.
+    containers = dict((cont, None) for cont in containers or [])
+    failures = teardown(containers, images or [], concurrency=concurrency)
+    if not failures:
+        print("Cleanup Successful.")
+    return failures
+
+
+def teardown(containers, images, concurrency=scheduler.DEFAULT_WORKERS):
+    """Remove containers and images on a pool of concurrency workers.
+
+    containers maps each container to the image it was created from, or
+    None if unknown. Each container is killed and removed in a single
+    forced removal, and each image is removed as soon as every container
+    using it is gone. Failures do not stop the teardown; they are reported
+    at the end and returned as a list of (object, error) pairs.
+    """
+    daemon = current_daemon()
+    # Subscribe first so no change after the listing is missed.
+    watch_events()
+    refresh_state()
+    dependencies = {}
+    for cont in containers:
+        dependencies[('container', cont)] = set()
+    for image in images:
+        dependencies[('image', image)] = set(
+            ('container', cont) for cont, cont_image in containers.items()
+            if cont_image in (image, None))
+
+    def remove(node):
+        kind, name = node
+        with on_daemon(daemon), timing.span(name[:12], 'teardown',
+                                            kind=kind):
+            if kind == 'container':
+                if remove_container(name, force=True) is False:
+                    raise Exception("Container was not removed.")
+            # remove_image also returns False when there was nothing to
+            # remove.
+            elif remove_image(name) is False and inspect_image(name):
+                raise Exception("Image was not removed.")
+
+    results, errors = scheduler.run_graph(dependencies, remove,
+                                          max_workers=concurrency,
+                                          stop_on_error=False)
+    failures = [(name, error) for (kind, name), error in errors.items()]
+    for node in dependencies:
+        if node not in results and node not in errors:
+            failures.append((node[1], "Skipped because a container using "
+                                      "it could not be removed."))
+    if failures:
+        print("Teardown finished with %d failure(s):" % len(failures))
+        for name, error in sorted(failures):
+            print("  %s: %s" % (name, error))
+    return failures
 
 
 def create(image, command=None, hostname=None, user=None, detach=False,
@@ -181,28 +577,35 @@ def create(image, command=None, hostname=None, user=None, detach=False,
            network_disabled=False, name=None, entrypoint=None, cpu_shares=None,
            working_dir=None):
     """Create a Docker container from an image."""
-    c = connect()
     print("Creating %s container." % image)
-    cont = c.create_container(image, command=command, hostname=hostname,
-                              user=user, detach=detach,
-                              stdin_open=stdin_open, tty=tty,
-                              mem_limit=mem_limit, ports=ports,
-                              environment=environment, dns=dns,
-                              volumes=volumes, volumes_from=volumes_from,
-                              name=name)
+    with client() as c:
+        cont = c.create_container(image, command=command, hostname=hostname,
+                                  user=user, detach=detach,
+                                  stdin_open=stdin_open, tty=tty,
+                                  mem_limit=mem_limit, ports=ports,
+                                  environment=environment, dns=dns,
+                                  volumes=volumes, volumes_from=volumes_from,
+                                  network_disabled=network_disabled,
+                                  name=name, entrypoint=entrypoint,
+                                  cpu_shares=cpu_shares,
+                                  working_dir=working_dir)
+    current_daemon().state.add_container(cont['Id'], [name] if name else [])
     print("Successfully created %s container: %s" % (image[:12],
                                                      cont['Id'][:12]))
     return cont['Id']
 
 
-def get_ip_address():
-    """Attempts to get IP address for eth1, falls back to eth0."""
+def get_ip_address(docker_host=None):
+    """Attempts to get IP address for eth1, falls back to eth0.
+
+    If docker_host (or DOCKER_HOST) names a remote daemon, returns its
+    address instead.
+    """
     # For boot2docker and docker-osx compatibility.
-    if 'DOCKER_HOST' in os.environ.keys():
-        if ('127.0.0.1' or 'localhost') not in os.environ['DOCKER_HOST']:
-            host = urllib2.urlparse.urlparse(os.environ['DOCKER_HOST'])[1]
-            if ':' in host:
-                host = host.split(":")[0]
+    docker_host = docker_host or os.environ.get('DOCKER_HOST')
+    if docker_host:
+        host = urllib2.urlparse.urlparse(docker_host)[1].split(':')[0]
+        if host and host not in ('127.0.0.1', 'localhost'):
             return host
 
     try:
@@ -213,11 +616,11 @@ def get_ip_address():
     return host
 
 
-def kill(container, signal=None):
-    c = connect()
+def kill(container, signal=None, timeout=STATE_TIMEOUT):
     print("Killing container %s." % container[:12])
-    c.kill(container, signal)
-    if not check_if_running(container):
+    with client() as c:
+        c.kill(container, signal)
+    if wait_for_container(container, running=False, timeout=timeout):
         print("Successfully killed container %s." % container[:12])
         return True
     else:
@@ -225,117 +628,394 @@ def kill(container, signal=None):
         return False
 
 
-def pull(repository, tag='latest', stream=False):
-    """Pull a Docker image from the Index."""
-    c = connect()
-    # TODO(rwalker): Docker-py does not seem to support pulling
-    # specific tags even though it is documented. For now
-    # we will always default to 'latest'.
-    tag = 'latest'
+def logs(container):
+    """Return the stdout and stderr a container has written so far."""
+    with client() as c:
+        return c.logs(container)
+
+
+def attach_logs(capture, label, container):
+    """Stream a container's output, from its start, into a LogCapture.
+
+    An attached connection cannot be shared, so it gets its own client.
+    Failing to attach only costs the output, so it is reported and
+    ignored.
+    """
+    try:
+        c = connect(timeout=None, base_url=current_daemon().url)
+        sock = c.attach_socket(container, params={'stdout': 1, 'stderr': 1,
+                                                  'stream': 1, 'logs': 1})
+        capture.add(label, sock, owner=c)
+    except Exception as exc:
+        print("Unable to capture the output of %s: %s" % (label, exc))
+
+
+PULL_POLICIES = specs.PULL_POLICIES
+
+
+def pull(repository, tag='latest', stream=False, policy='always'):
+    """Pull a Docker image from the Index.
+
+    With policy 'if-not-present', the pull is skipped if the daemon already
+    has repository:tag. With 'never', it must already have it.
+    """
+    tag = tag or 'latest'
+    if policy not in PULL_POLICIES:
+        raise Exception("Unknown pull policy for %s:%s: %s" %
+                        (repository, tag, policy))
+    if policy != 'always' and check_if_image_exists(repository, tag):
+        print("Skipping pull of %s:%s." % (repository, tag))
+        return True
+    if policy == 'never':
+        raise Exception("Image %s:%s is not present and its pull policy "
+                        "is never." % (repository, tag))
     print("Pulling %s:%s from registry." % (repository, tag))
-    c.pull(repository, stream=stream)
-    time.sleep(5)
-    if check_if_image_exists(repository, tag):
+    with client() as c:
+        c.pull(repository, tag=tag, stream=stream)
+    if inspect_image("%s:%s" % (repository, tag)):
         print("Successfully pulled %s:%s." % (repository, tag))
         return True
     else:
         raise Exception("Failed to pull %s:%s." % (repository, tag))
 
 
-def remove_container(container):
-    """Remove a Docker container from the system."""
-    c = connect()
+def remove_container(container, force=False):
+    """Remove a Docker container from the system.
+
+    With force, a running container is killed as part of the removal.
+    """
     print("Removing container %s." % container[:12])
     if check_if_container_exists(container):
-        c.remove_container(container)
-        if not check_if_container_exists(container):
+        with client() as c:
+            c.remove_container(container, force=force)
+        if wait_for_container(container, removed=True):
             print("Successfully removed container %s." % container[:12])
+            return True
         else:
             print("Failed to remove container: %s." % container[:12])
+            return False
     else:
         print("Container %s not found. Skipping..." % container[:12])
 
 
 def remove_image(image, tag="latest"):
     """Remove a Docker image from the system."""
-    c = connect()
     # Sometimes images may be passed with a tag included.
     if ':' in image:
         tag = image.split(':')[1]
         image = image.split(':')[0]
         print("Removing image %s:%s." % (image, tag))
-        if check_if_image_exists(image):
-            c.remove_image(image)
+        removed = image + ':' + tag
+        if check_if_image_exists(image, tag):
+            with client() as c:
+                c.remove_image(removed)
         else:
             print("Image %s:%s not found. Skipping..." % (image, tag))
             return False
     else:
         try:
             print("Removing image %s:%s." % (image, tag))
-            imagetags = image + ':' + tag
-            c.remove_image(imagetags)
-        except docker.APIError:
+            removed = image + ':' + tag
+            with client() as c:
+                c.remove_image(removed)
+        except docker.errors.APIError:
             # Probably an image ID, so it has no tag.
+            removed = image
             if check_if_image_exists(image):
-                c.remove_image(image)
+                with client() as c:
+                    c.remove_image(image)
             else:
                 print("Image %s not found. Skipping..." % image)
                 return False
 
-    if not check_if_image_exists(image, tag):
+    if not inspect_image(removed):
         print("Successfully removed image %s:%s." % (image, tag))
+        return True
     else:
         print("Failed to remove image %s:%s." % (image, tag))
+        return False
 
 
 def select_random_port():
-    retries = 10
-    while retries:
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
-            sock.bind(('', 0))
-            port = sock.getsockname()[1]
-            sock.close()
-            return port
-        except Exception:
-            if retries == 1:
-                raise Exception("Unable to select random port. Aborting.")
-            print("Unable to bind to port. Retrying...")
-            retries -= 1
+    """Lease a free host port for the rest of the run."""
+    return ports.allocate()
+
+
+def published_port(container, cont_port):
+    """Read back the host port Docker mapped to a container port."""
+    with client() as c:
+        mapping = c.port(container, cont_port)
+    return int(mapping[0]['HostPort'])
 
 
 def start(container, binds=None, port_bindings=None, lxc_conf=None,
           publish_all_ports=False, links=None):
     """Start a Docker container."""
-    c = connect()
     print("Starting container %s." % container[:12])
-    c.start(container, binds=binds, port_bindings=port_bindings,
-            lxc_conf=lxc_conf, publish_all_ports=publish_all_ports,
-            links=links)
-    time.sleep(6)
-    if check_if_running(container):
+    with client() as c:
+        c.start(container, binds=binds, port_bindings=port_bindings,
+                lxc_conf=lxc_conf, publish_all_ports=publish_all_ports,
+                links=links)
+    if wait_for_container(container, running=True):
         print("Successfully started container %s." % container[:12])
         return True
+    else:
+        print("Failed to start container %s." % container[:12])
+        return False
 
 
 def stop(container):
     """Stop a running container."""
-    c = connect()
     print("Stopping container %s." % container[:12])
-    c.stop(container=container)
-    if not check_if_running(container):
+    with client() as c:
+        c.stop(container=container)
+    if wait_for_container(container, running=False):
         print("Successfully stopped container %s." % container[:12])
         return True
+    else:
+        print("Failed to stop container %s." % container[:12])
+        return False
+
+
+def wait_until_ready(data, host, warmup=True):
+    """Wait for a started resource to pass its readiness probe.
+
+    Resources without a 'readiness' section wait 'warmup' seconds instead,
+    unless warmup is False.
+    """
+    name = data.get('name', data['container'][:12])
+    if 'readiness' not in data.keys():
+        if warmup:
+            time.sleep(data.get('warmup', 10))
+        return
+    probe = data['readiness']
+    kind = probe.get('type', 'tcp')
+    port = probe.get('port', data.get('host_port'))
+    if kind == 'tcp':
+        check = lambda: probes.tcp(host['ip'], port)
+    elif kind == 'http':
+        url = "http://%s:%s%s" % (host['ip'], port, probe.get('path', '/'))
+        check = lambda: probes.http(url)
+    elif kind == 'log':
+        check = lambda: probes.log(lambda: logs(data['container']),
+                                   probe['pattern'])
+    elif kind == 'exec':
+        cmd = probe['command']
+        if isinstance(cmd, basestring):
+            cmd = ['sh', '-c', cmd]
+        argv = docker_command('exec', data['container'], *cmd)
+        check = lambda: probes.command(argv)
+    else:
+        raise Exception("Unknown readiness probe type for %s: %s" %
+                        (name, kind))
+
+    print("Waiting for %s to become ready (%s probe)." % (name, kind))
+    waited = probes.poll(
+        check,
+        timeout=probe.get('timeout', probes.DEFAULT_TIMEOUT),
+        interval=probe.get('interval', probes.DEFAULT_INTERVAL),
+        max_interval=probe.get('max_interval', probes.DEFAULT_MAX_INTERVAL))
+    if waited is None:
+        raise Exception("%s did not become ready within %s seconds." %
+                        (name, probe.get('timeout', probes.DEFAULT_TIMEOUT)))
+    print("%s ready after %.2f seconds." % (name, waited))
+
+
+def seed(data):
+    """Run a started resource's seed command inside its container."""
+    name = data.get('name', data['container'][:12])
+    cmd = data['seed']
+    if isinstance(cmd, basestring):
+        cmd = ['sh', '-c', cmd]
+    print("Seeding %s." % name)
+    if subprocess.call(docker_command('exec', data['container'], *cmd)):
+        raise Exception("Seeding %s failed." % name)
+
+
+def snapshot_image(data, definition):
+    """Name the snapshot image of a seeded resource.
+
+    definition is the resource as configured, before references to other
+    resources are resolved, with its image resolved. Docker API 1.10 has no
+    image labels, so the key is carried in the tag.
+    """
+    spec = dict(definition, image=data['image'])
+    # Resource limits do not change what a seed writes, and may still be
+    # templates here.
+    spec.pop('mem_limit', None)
+    spec.pop('cpu_shares', None)
+    key = snapshots.snapshot_key(resource_fingerprint(spec),
+                                 data.get('seed'), data.get('seed_files'))
+    return "%s:%s" % (snapshots.repository(data.get('name', 'resource')),
+                      key)
+
+
+def commit_snapshot(container, image):
+    """Commit a container to image and record it in the snapshot index."""
+    repository, tag = image.rsplit(':', 1)
+    print("Committing container %s to snapshot %s." % (container[:12],
+                                                       image))
+    with client(timeout=600) as c:
+        c.commit(container, repository=repository, tag=tag)
+    info = inspect_image(image)
+    if not info:
+        raise Exception("Failed to commit snapshot %s." % image)
+    snapshots.touch(image, current_daemon().url, size=info.get('Size', 0))
+
+
+def evict_snapshots(budget, keep=()):
+    """Remove the least recently used snapshots until under budget bytes.
+
+    keep lists (image, daemon URL) pairs that must not be removed.
+    """
+    for image, url in snapshots.evictable(budget, keep):
+        print("Evicting snapshot %s." % image)
+        with on_daemon(get_daemon(url)):
+            try:
+                remove_image(image)
+            except docker.errors.APIError as exc:
+                # Still used by a container, perhaps another run's.
+                print("Could not evict snapshot %s: %s" % (image, exc))
+                continue
+        snapshots.forget(image, url)
+
+
+def resource_fingerprint(data):
+    """Hash the options a resolved resource's container is created with.
+
+    The resource is compiled as create_container would compile it, so any
+    change to what is sent to Docker changes the fingerprint. A host_port
+    of {{random_port}} or {{auto_port}} is hashed as written, so a reused
+    container keeps whatever port it was given.
+    """
+    spec = specs.ContainerSpec.from_resource(data)
+    options = dict(spec.create_options(),
+                   port_bindings=spec.port_bindings,
+                   binds=spec.binds)
+    return hashlib.sha1(json.dumps(options, sort_keys=True)).hexdigest()
+
+
+def container_name(name, fingerprint):
+    """Name a reusable container after its resource and fingerprint.
+
+    Docker API 1.10 has no container labels, so the fingerprint is
+    carried in the name.
+    """
+    name = re.sub('[^a-zA-Z0-9_.-]', '_', str(name))
+    return "galley-%s-%s" % (name, fingerprint[:12])
+
+
+def adopt(data, name):
+    """Adopt a running container left by an earlier run for a resource.
+
+    Returns True if the container named name was adopted. A stopped one is
+    removed so that it can be recreated.
+    """
+    found = daemon_state().find_container(name)
+    if not found:
+        return False
+    if not is_running(found['Id']):
+        print("Removing stopped container %s." % name)
+        remove_container(found['Id'], force=True)
+        return False
+    print("Reusing container %s for %s." % (found['Id'][:12],
+                                            data.get('name', name)))
+    data['container'] = found['Id']
+    if data.get('host_port') in ("{{random_port}}", "{{auto_port}}"):
+        data['host_port'] = published_port(found['Id'], data['cont_port'])
+    return True
 
 
 def load_yaml(filepath):
     """Convert YAML file to Python object."""
     with open(filepath, 'r') as infile:
-        return yaml.load(infile.read())
+        return configfile.load(infile)
+
+
+def place(copies, daemons):
+    """Assign every resource of every shard to one of daemons.
+
+    A resource weighs its mem_limit against each daemon's memory and its
+    cpu_shares (1024 to a CPU) against each daemon's cpus. Resources are
+    placed heaviest first, each on the daemon that is least loaded once it
+    is added; ties go to the daemon with the fewest resources. Returns
+    {(shard, resource key): index into daemons}.
+    """
+    placement = {}
+    if len(daemons) == 1:
+        for shard, resources in enumerate(copies):
+            for index in resources:
+                placement[(shard, index)] = 0
+        return placement
 
+    def demand(data):
+        return (specs.parse_size(data.get('mem_limit')) or 0,
+                float(data.get('cpu_shares') or 0) / 1024)
 
-def build_environment(config):
-    """Build and return test environment."""
+    memory = [0] * len(daemons)
+    cpus = [0.0] * len(daemons)
+    count = [0] * len(daemons)
+
+    def load(d, mem, cpu):
+        fractions = [0.0]
+        if daemons[d].memory:
+            fractions.append(float(memory[d] + mem) / daemons[d].memory)
+        if daemons[d].cpus:
+            fractions.append((cpus[d] + cpu) / daemons[d].cpus)
+        return max(fractions)
+
+    pending = sorted(((demand(data), shard, index)
+                      for shard, resources in enumerate(copies)
+                      for index, data in resources.iteritems()),
+                     key=lambda p: (-p[0][0], -p[0][1], p[1], str(p[2])))
+    for (mem, cpu), shard, index in pending:
+        d = min(range(len(daemons)),
+                key=lambda d: (load(d, mem, cpu), count[d], d))
+        if load(d, mem, cpu) > 1:
+            print("Warning: %s exceeds the declared capacity of every "
+                  "daemon. Placing it on %s." %
+                  (copies[shard][index].get('name', index), daemons[d]))
+        memory[d] += mem
+        cpus[d] += cpu
+        count[d] += 1
+        placement[(shard, index)] = d
+    return placement
+
+
+def build_environment(config, concurrency=scheduler.DEFAULT_WORKERS,
+                      pull_concurrency=scheduler.DEFAULT_PULL_WORKERS,
+                      build_concurrency=scheduler.DEFAULT_BUILD_WORKERS,
+                      reuse=False, shards=1, state_file=None,
+                      log_capture=None):
+    """Build and return test environment.
+
+    With reuse, containers are named after a fingerprint of their resolved
+    resource definition, and running containers from an earlier run that
+    match are adopted instead of recreated.
+
+    state_file, a statefile.StateFile, reconciles the environment with the
+    one it records (and implies reuse): containers of resources that are no
+    longer configured are removed, those whose definition changed are
+    replaced, and every container is recorded as soon as it exists.
+
+    log_capture, a logcapture.LogCapture, receives the output of every
+    container once it is started.
+
+    A resource's seed command is run once it is ready. With snapshot, the
+    seeded container is then committed to an image, and later runs create
+    the resource from that image without seeding it again. Snapshots are
+    kept until they take more than the config's snapshot_budget, when the
+    least recently used are removed.
+
+    With more than one shard, that many independent copies of the resources
+    are brought up from the same images, and the environment's 'shards'
+    lists the resources of every copy; see shard_environment.
+
+    If the config lists several daemons, resources are spread across them
+    (see place), each image is acquired on every daemon that runs a
+    resource using it, and each resource records its 'daemon' index and
+    'host'.
+    """
 
     images = config['images']
     resources = config['resources']
@@ -343,132 +1023,430 @@ def build_environment(config):
         testparams = config['testparams']
     else:
         testparams = {}
-    environ = os.environ
+    daemons = configure_daemons(config.get('daemons'))
+    reserve_clients(concurrency + pull_concurrency + build_concurrency)
+    snapshot_budget = specs.parse_size(
+        config.get('snapshot_budget', snapshots.DEFAULT_BUDGET))
+    for index, data in images.iteritems():
+        specs.validate_image(index, data)
+    # Must be worked out before templates referencing images and other
+    # resources are substituted.
+    image_keys = dict((image['name'], key)
+                      for key, image in images.iteritems())
+    dependencies = scheduler.resource_dependencies(resources)
+    uses = {}
+    referenced = {}
+    for index, data in resources.iteritems():
+        specs.validate(index, data)
+        referenced[index] = scheduler.referenced_resources(resources, data)
+        referenced[index].discard(index)
+        uses[index] = set(image_keys[ref.root]
+                          for ref in template.references(data['image'])
+                          if ref.root in image_keys)
+        if shards > 1 and data.get('host_port') not in \
+                (None, "{{random_port}}", "{{auto_port}}"):
+            raise Exception("Resource %s needs a {{random_port}} or "
+                            "{{auto_port}} host_port to be sharded." % index)
 
     # TODO(rwalker): Add more host attributes as needed.
-    host = {
-        'ip': get_ip_address()
-    }
-
-    # TODO(rwalker): There has to be a better way to do this without
-    #                going full Jinja.
+    hosts = [{'ip': daemon.ip} for daemon in daemons]
+    host = hosts[0]
 
     # Populate environment variables in config
-    for index, data in images.iteritems():
-        for key, value in data.iteritems():
-            if type(value) is dict:
-                for k, v in value.iteritems():
-                    for match in re.findall('{{environ.*?}}', str(v)):
-                        sub = eval(re.sub('{{|}}', '', match), locals(), {})
-                        v = v.replace(match, str(sub))
-                        images[index][key][k] = v
-            else:
-                for match in re.findall('{{environ.*?}}', str(value)):
-                    sub = eval(re.sub('{{|}}', '', match), locals(), {})
-                    value = value.replace(match, str(sub))
-                    images[index][key] = value
+    context = {'environ': os.environ}
+    images = template.render(images, context, 'images')
+    resources = template.render(resources, context, 'resources')
+    testparams = template.render(testparams, context, 'testparams')
+    copies = [resources] + [copy.deepcopy(resources)
+                            for shard in range(1, shards)]
+    placement = place(copies, daemons)
+    if len(daemons) > 1:
+        for (shard, index), d in placement.items():
+            copies[shard][index]['daemon'] = d
+            copies[shard][index]['host'] = hosts[d]
 
-    for index, data in resources.iteritems():
-        for key, value in data.iteritems():
-            if type(value) is dict:
-                for k, v in value.iteritems():
-                    for match in re.findall('{{environ.*?}}', str(v)):
-                        sub = eval(re.sub('{{|}}', '', match), locals(), {})
-                        v = v.replace(match, str(sub))
-                        resources[index][key][k] = v
-            else:
-                for match in re.findall('{{environ.*?}}', str(value)):
-                    sub = eval(re.sub('{{|}}', '', match), locals(), {})
-                    value = value.replace(match, str(sub))
-                    resources[index][key] = value
-
-    for key, value in testparams.iteritems():
-        for match in re.findall('{{environ.*?}}', str(value)):
-            sub = eval(re.sub('{{|}}', '', match), locals(), {})
-            value = value.replace(match, str(sub))
-            testparams[key] = value
-
-    # Build images and write back values
-    for index, data in images.iteritems():
-        if data['action'] == 'pull':
-            pull(data['source'])
-            images[index]['image'] = data['source']
-        if data['action'] == 'build':
-            image = build(path=data['source'], tag=data['name'], rm=True)
-            images[index]['image'] = image
+    # Each image is needed on the daemons running resources that use it.
+    # Images no resource uses are acquired on the first daemon.
+    needed = set((d, image) for (shard, index), d in placement.items()
+                 for image in uses[index])
+    for index in images:
+        if not any(image == index for d, image in needed):
+            needed.add((0, index))
+    graph = {}
+    for d, index in needed:
+        graph[('image', d, index)] = set()
+    for shard in range(shards):
+        for index, deps in dependencies.iteritems():
+            # A container can be created once its image is ready and the
+            # resources its definition refers to are up, and started once
+            # everything it depends on is up.
+            create_node = ('create', shard, index)
+            graph[create_node] = set(('resource', shard, d)
+                                     for d in referenced[index])
+            graph[create_node].update(
+                ('image', placement[(shard, index)], image)
+                for image in uses[index])
+            graph[('resource', shard, index)] = set(
+                ('resource', shard, d) for d in deps)
+            graph[('resource', shard, index)].add(create_node)
 
-    for index, data in resources.iteritems():
-        if data['host_port'] == "{{random_port}}":
+    # Acquire images and write back values
+    acquired = {}
+
+    def acquire(d, index):
+        data = images[index]
+        tags = {'source': data['source']}
+        if len(daemons) > 1:
+            tags['daemon'] = str(daemons[d])
+        with timing.span(data['name'], data['action'], **tags):
+            if data['action'] == 'pull':
+                tag = data.get('tag') or 'latest'
+                pull(data['source'], tag, policy=specs.pull_policy(data))
+                acquired[(d, index)] = "%s:%s" % (data['source'], tag)
+            if data['action'] == 'build':
+                acquired[(d, index)] = build(
+                    path=data['source'], tag=data['name'], rm=True,
+                    cache=data.get('cache', True))
+
+    def resolve(value, shard, own, path):
+        """Render a resource value against the resources it references.
+
+        {{host}} in a string means the host of the one resource the string
+        references, if there is exactly one, or else the resource's own.
+        """
+        if isinstance(value, dict):
+            return dict((k, resolve(v, shard, own, "%s.%s" % (path, k)))
+                        for k, v in value.items())
+        if isinstance(value, list):
+            return [resolve(v, shard, own, "%s[%d]" % (path, i))
+                    for i, v in enumerate(value)]
+        keys = scheduler.referenced_resources(copies[shard], value)
+        d = placement[(shard, keys.pop())] if len(keys) == 1 else own
+        return template.render(value, {'resources': copies[shard],
+                                       'host': hosts[d]}, path)
+
+    # Containers are created as soon as they can be, all at the same time,
+    # and each is started once the resources it depends on are up.
+    compiled = {}
+    # Ports leased for this environment, released by clean.
+    leased = []
+    # Maps resources with a snapshot to their snapshot image and whether
+    # they were created from it.
+    snapshotted = {}
+    reuse = reuse or state_file is not None
+
+    def resource_name(shard, index, data):
+        name = str(data.get('name', index))
+        if shards > 1:
+            name = "%s-shard%d" % (name, shard)
+        return name
+
+    def create_container(shard, index):
+        resources = copies[shard]
+        path = 'resources.%s' % index
+        own = placement[(shard, index)]
+        # Find resource attr references and replace with value. The
+        # resources referenced are dependencies, so they are already up.
+        data = resolve(resources[index], shard, own, path)
+        # Find image references in resources and replace with
+        # image names/IDs
+        image_ids = dict((images[i]['name'], image)
+                         for (d, i), image in acquired.items() if d == own)
+        data['image'] = template.render(data['image'], image_ids,
+                                        path + '.image')
+        definition = resources[index]
+        resources[index] = data
+
+        tags = {'shard': shard} if shards > 1 else {}
+        key = resource_name(shard, index, data)
+        name = None
+        if reuse:
+            try:
+                fingerprint = resource_fingerprint(data)
+            except Exception as exc:
+                raise Exception("%s: %s" % (path, exc))
+            name = container_name(key, fingerprint)
+            entry = state_file.get(key) if state_file is not None else None
+            if entry and entry['fingerprint'] != fingerprint:
+                print("%s has changed. Replacing container %s." %
+                      (key, entry['container'][:12]))
+                with on_daemon(get_daemon(entry['daemon'])):
+                    remove_container(entry['container'], force=True)
+                state_file.remove(key)
+            if adopt(data, name):
+                if state_file is not None:
+                    state_file.set(key, data['container'], fingerprint,
+                                   daemon=current_daemon().url)
+                return
+        if data.get('snapshot'):
+            image = snapshot_image(data, definition)
+            repository, tag = image.rsplit(':', 1)
+            restored = bool(check_if_image_exists(repository, tag))
+            if restored:
+                # Already seeded, so start from the snapshot.
+                data['image'] = image
+            snapshotted[(shard, index)] = (image, restored)
+        if data.get('host_port') == "{{random_port}}":
             data['host_port'] = select_random_port()
-    # Find image references in resources and replace with
-    # image names/IDs
-    for index, data in resources.iteritems():
-        for key, image in images.iteritems():
-            if re.sub('{{|}}', '', data['image']) == image['name']:
-                resources[index]['image'] = image['image']
-        # Find resource attr references and replace with value
-        if 'environment' in data.keys():
-            for key, value in data['environment'].iteritems():
-                for match in re.findall('{{resources.*?}}', value):
-                    v = eval(re.sub('{{|}}', '', match), locals(), {})
-                    value = value.replace(match, str(v))
-                    resources[index]['environment'][key] = value
-                for match in re.findall('{{host.*?}}', value):
-                    v = eval(re.sub('{{|}}', '', match), locals(), {})
-                    value = value.replace(match, str(v))
-                    resources[index]['environment'][key] = value
-    # Create containers
-    for index, data in resources.iteritems():
-        if 'cont_port' in data.keys():
-            ports = data['cont_port']
-        else:
-            ports = None
-        if 'command' in data.keys():
-            command = data['command']
-        else:
-            command = None
-        if 'cont_volume' in data.keys():
-            volumes = data['cont_volume']
-        else:
-            volumes = None
-        if 'environment' in data.keys():
-            environment = data['environment']
+            leased.append(data['host_port'])
+        try:
+            spec = specs.ContainerSpec.from_resource(data, name)
+        except Exception as exc:
+            raise Exception("%s: %s" % (path, exc))
+        with timing.span(data.get('name', index), 'create', **tags):
+            data['container'] = create(**spec.create_options())
+        if state_file is not None:
+            state_file.set(key, data['container'], fingerprint,
+                           daemon=current_daemon().url)
+        compiled[(shard, index)] = spec
+
+    def bring_up(shard, index):
+        data = copies[shard][index]
+        own = placement[(shard, index)]
+        tags = {'shard': shard} if shards > 1 else {}
+        label = data.get('name', index)
+        spec = compiled.get((shard, index))
+        if log_capture is not None and spec is None:
+            attach_logs(log_capture, resource_name(shard, index, data),
+                        data['container'])
+        if spec is None:
+            # Adopted from an earlier run, so already started.
+            with timing.span(label, 'readiness', **tags):
+                wait_until_ready(data, hosts[own], warmup=False)
+            return
+
+        container = data['container']
+        auto_port = data.get('host_port') == "{{auto_port}}"
+        with timing.span(label, 'start', **tags):
+            if not start(container, port_bindings=spec.port_bindings,
+                         binds=spec.binds):
+                raise Exception("Container %s is not running." %
+                                container[:12])
+            if log_capture is not None:
+                attach_logs(log_capture, resource_name(shard, index, data),
+                            container)
+            if auto_port and 'cont_port' in data.keys():
+                data['host_port'] = published_port(container,
+                                                   data['cont_port'])
+        with timing.span(label, 'readiness', **tags):
+            wait_until_ready(data, hosts[own])
+        image, restored = snapshotted.get((shard, index), (None, False))
+        if restored:
+            snapshots.touch(image, current_daemon().url)
+            return
+        if data.get('seed'):
+            with timing.span(label, 'seed', **tags):
+                seed(data)
+        if image:
+            with timing.span(label, 'snapshot', **tags):
+                commit_snapshot(container, image)
+
+    def run(node):
+        if node[0] == 'image':
+            with on_daemon(daemons[node[1]]):
+                acquire(*node[1:])
+        elif node[0] == 'create':
+            with on_daemon(daemons[placement[node[1:]]]):
+                create_container(*node[1:])
         else:
-            environment = None
-        container = create(data['image'], command=command, ports=[ports],
-                           volumes=[volumes], environment=environment)
-        resources[index]['container'] = container
-    # Start containers
-    for index, data in resources.iteritems():
-        port_bindings = None
-        binds = None
-        if 'cont_port' in data.keys():
-            if 'host_port' in data.keys():
-                port_bindings = {data['cont_port']: data['host_port']}
-        if 'host_volume' in data.keys():
-            if 'cont_volume' in data.keys():
-                host_volume = os.path.abspath(data['host_volume'])
-                binds = {host_volume: data['cont_volume']}
-        start(data['container'], port_bindings=port_bindings, binds=binds)
-        time.sleep(10)  # Allow container to warm-up before starting next one
+            with on_daemon(daemons[placement[node[1:]]]):
+                bring_up(*node[1:])
+
+    def node_kind(node):
+        if node[0] == 'image':
+            return images[node[2]]['action']
+        return node[0]
+
+    for daemon in daemons:
+        with on_daemon(daemon):
+            # Subscribe first so no change after the listing is missed.
+            watch_events()
+            refresh_state()
+    if state_file is not None:
+        configured = set(resource_name(shard, index, data)
+                         for shard, resources in enumerate(copies)
+                         for index, data in resources.iteritems())
+        for key in sorted(set(state_file.keys()) - configured):
+            entry = state_file.get(key)
+            print("%s is no longer configured. Removing container %s." %
+                  (key, entry['container'][:12]))
+            with on_daemon(get_daemon(entry['daemon'])):
+                remove_container(entry['container'], force=True)
+            state_file.remove(key)
+    _, errors = scheduler.run_graph(
+        graph, run,
+        max_workers=concurrency + pull_concurrency + build_concurrency,
+        kind=node_kind,
+        limits={'pull': pull_concurrency,
+                'build': build_concurrency,
+                'create': concurrency,
+                'resource': concurrency})
+    if errors:
+        for node, error in sorted(errors.items()):
+            print("Failed to set up %s %s: %s" % (
+                node[0], '/'.join(str(n) for n in node[1:]), error))
+        ports.release(leased)
+        raise Exception("Failed to build environment.")
+
+    for (d, index), image in sorted(acquired.items(), reverse=True):
+        images[index]['image'] = image
+        if len(daemons) > 1:
+            images[index].setdefault('image_ids', {})[d] = image
+    # Snapshots outlive the environment, so clean leaves them be; they are
+    # evicted instead once they take more than the budget.
+    in_use = set()
+    for (shard, index), (image, restored) in sorted(snapshotted.items()):
+        d = placement[(shard, index)]
+        in_use.add((image, daemons[d].url))
+        entry = images.setdefault('snapshot:%s' % image, {
+            'name': image, 'action': 'snapshot', 'source': image,
+            'image': image, 'persist': True})
+        if len(daemons) > 1:
+            entry.setdefault('image_ids', {})[d] = image
+    if in_use:
+        evict_snapshots(snapshot_budget, keep=in_use)
 
     environment = config
     environment['host'] = host
     environment['images'] = images
     environment['resources'] = resources
     environment['testparams'] = testparams
+    environment['leased_ports'] = leased
+    if shards > 1:
+        environment['shards'] = copies
 
     return environment
 
 
-def run_tests(config, test_file_pattern, nodestroy):
+def up(config, state_path=statefile.DEFAULT_PATH,
+       concurrency=scheduler.DEFAULT_WORKERS,
+       pull_concurrency=scheduler.DEFAULT_PULL_WORKERS,
+       build_concurrency=scheduler.DEFAULT_BUILD_WORKERS, shards=1):
+    """Bring an environment up and leave it running.
+
+    The containers recorded in the state file at state_path are reconciled
+    with the config: only resources that are missing or whose definition
+    changed are (re)created, and resources no longer configured are
+    removed. Returns the environment.
+    """
     start_time = time.time()
+    with timing.span('up', 'run'):
+        environment = build_environment(
+            config, concurrency=concurrency,
+            pull_concurrency=pull_concurrency,
+            build_concurrency=build_concurrency, shards=shards,
+            state_file=statefile.StateFile(state_path))
+    # Docker holds the ports of the running containers now.
+    ports.release(environment['leased_ports'])
+    stop_watching_events()
+    timing.print_summary()
+    print("\nEnvironment is up. State recorded in %s." % state_path)
+    print("Total Elapsed Time: %.2f seconds." % (time.time() - start_time))
+    return environment
+
+
+def down(state_path=statefile.DEFAULT_PATH,
+         concurrency=scheduler.DEFAULT_WORKERS):
+    """Remove every container recorded in the state file at state_path.
+
+    Returns a list of (container, error) pairs for failed removals; the
+    containers removed are dropped from the state file.
+    """
+    recorded = statefile.StateFile(state_path)
+    by_daemon = {}
+    for key in recorded.keys():
+        entry = recorded.get(key)
+        by_daemon.setdefault(entry['daemon'], {})[entry['container']] = None
+    failures = []
+    for url, containers in sorted(by_daemon.items()):
+        with on_daemon(get_daemon(url)):
+            failures.extend(teardown(containers, [],
+                                     concurrency=concurrency))
+    failed = set(name for name, error in failures)
+    for key in recorded.keys():
+        if recorded.get(key)['container'] not in failed:
+            recorded.remove(key)
+    stop_watching_events()
+    return failures
+
+
+def prefetch(config, pull_concurrency=scheduler.DEFAULT_PULL_WORKERS,
+             policy=None):
+    """Pull every image a config pulls onto every daemon it lists.
+
+    Each image follows its own pull_policy unless policy overrides it;
+    images that are never pulled are skipped. Images the config builds are
+    left alone. Returns a list of (image, error) pairs for failed pulls.
+    """
+    daemons = configure_daemons(config.get('daemons'))
+    reserve_clients(pull_concurrency)
+    images = template.render(config['images'], {'environ': os.environ},
+                             'images')
+    graph = {}
+    for d, daemon in enumerate(daemons):
+        with on_daemon(daemon):
+            refresh_state()
+        for index, data in images.iteritems():
+            if data['action'] == 'pull' and \
+                    (policy or specs.pull_policy(data)) != 'never':
+                graph[(d, index)] = set()
+
+    def warm(node):
+        d, index = node
+        data = images[index]
+        with on_daemon(daemons[d]), timing.span(data['name'], 'pull',
+                                                source=data['source']):
+            pull(data['source'], data.get('tag') or 'latest',
+                 policy=policy or specs.pull_policy(data))
+
+    _, errors = scheduler.run_graph(graph, warm,
+                                    max_workers=pull_concurrency,
+                                    stop_on_error=False)
+    failures = []
+    for (d, index), error in sorted(errors.items()):
+        name = images[index]['name']
+        if len(daemons) > 1:
+            name = "%s on %s" % (name, daemons[d])
+        failures.append((name, error))
+    if failures:
+        print("Prefetch finished with %d failure(s):" % len(failures))
+        for name, error in failures:
+            print("  %s: %s" % (name, error))
+    return failures
+
+
+def shard_environment(environment, shard):
+    """Return the environment as seen by tests running in one shard."""
+    shard_env = dict(environment)
+    shard_env.pop('shards', None)
+    if 'shards' in environment:
+        shard_env['resources'] = environment['shards'][shard]
+    return shard_env
+
 
-    environment = build_environment(config)
+DEFAULT_LOG_LINES = logcapture.DEFAULT_LOG_LINES
 
-    galley.set_environment(environment)
-    print("Waiting for containers to start...")
-    time.sleep(5)
+
+def run_tests(config, test_file_pattern, nodestroy,
+              concurrency=scheduler.DEFAULT_WORKERS,
+              pull_concurrency=scheduler.DEFAULT_PULL_WORKERS,
+              build_concurrency=scheduler.DEFAULT_BUILD_WORKERS,
+              reuse=False, workers=1, shards=1, profile=None,
+              profile_format='json', log_lines=DEFAULT_LOG_LINES):
+    start_time = time.time()
+    # Reused environments are left running for the next run.
+    nodestroy = nodestroy or reuse
+    # Keep the latest output of every container, to show if tests fail.
+    capture = logcapture.LogCapture(log_lines) if log_lines else None
+
+    with timing.span('setup', 'run'):
+        environment = build_environment(config, concurrency=concurrency,
+                                        pull_concurrency=pull_concurrency,
+                                        build_concurrency=build_concurrency,
+                                        reuse=reuse, shards=shards,
+                                        log_capture=capture)
+
+    galley.set_environment(shard_environment(environment, 0))
 
     # Discover and run all galley unittest files.
     tloader = unittest.TestLoader()
@@ -476,26 +1454,46 @@ def run_tests(config, test_file_pattern, nodestroy):
         os.getcwd(),
         pattern=test_file_pattern
     )
-    runner = unittest.runner.TextTestRunner()
     print("Running tests:\n")
-    results = runner.run(galleytests)
+    with timing.span('tests', 'run'):
+        if shards > 1:
+            results = runner.run_parallel(
+                galleytests,
+                [shard_environment(environment, n) for n in range(shards)])
+        elif workers > 1:
+            results = runner.run_parallel(galleytests, [environment],
+                                          workers)
+        else:
+            results = unittest.runner.TextTestRunner(
+                resultclass=runner.TimedTextTestResult).run(galleytests)
     test_count = results.testsRun
     test_errors = len(results.errors)
     test_failures = len(results.failures)
 
+    def finish():
+        if capture is not None:
+            capture.stop()
+        with timing.span('teardown', 'run'):
+            clean(environment, nodestroy, concurrency=concurrency)
+        stop_watching_events()
+        timing.print_summary()
+        if profile:
+            timing.write_profile(profile, profile_format)
+            print("\nWrote run profile to %s." % profile)
+        total_time = time.time() - start_time
+        print("\nTotal Elapsed Time: %.2f seconds." % total_time)
+
     if not results.wasSuccessful():
         print("\n   Tests Run: %d" % test_count)
         print("Tests Failed: %d" % test_failures)
         print(" Test Errors: %d" % test_errors)
-        clean(environment, nodestroy)
-        total_time = time.time() - start_time
-        print("\nTotal Elapsed Time: %.2f seconds." % total_time)
+        if capture is not None:
+            capture.dump(log_lines)
+        finish()
         sys.exit(1)
     else:
         print("\n   Tests Run: %d" % test_count)
         print("Tests Failed: %d" % test_failures)
         print(" Test Errors: %d\n" % test_errors)
-        clean(environment, nodestroy)
-        total_time = time.time() - start_time
-        print("\nTotal Elapsed Time: %.2f seconds." % total_time)
+        finish()
         sys.exit(0)
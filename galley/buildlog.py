@@ -0,0 +1,70 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+import re
+
+from galley import jsonstream
+
+DEFAULT_MAX_LINES = 200
+
+BUILT = re.compile(r'^Successfully built ([0-9a-f]+)\s*$')
+STEP = re.compile(r'^Step (\d+) : (.*)$')
+
+
+class BuildLog(object):
+    """Incrementally parses the JSON messages streamed by a build.
+
+    Chunks may split a message, or hold several (see jsonstream.Decoder);
+    a line that does not decode is kept as plain output. The last max_lines
+    lines of output are kept for error reports, and on_event, if given, is
+    called with an (event, text) pair for every 'step', 'output' and
+    'error'.
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, on_event=None):
+        self.image = None
+        self.error = None
+        self.lines = collections.deque(maxlen=max_lines)
+        self.on_event = on_event
+        self._stream = jsonstream.Decoder(
+            on_invalid=lambda text: self._handle({'stream': text}))
+
+    def feed(self, chunk):
+        """Parse every complete message now available."""
+        for msg in self._stream.feed(chunk):
+            self._handle(msg)
+
+    def _handle(self, msg):
+        for line in (msg.get('stream') or '').splitlines():
+            self.lines.append(line)
+            built = BUILT.match(line)
+            step = STEP.match(line)
+            if built:
+                self.image = built.group(1)
+            if step:
+                self._emit('step', line)
+            else:
+                self._emit('output', line)
+        if msg.get('error'):
+            self.error = msg['error']
+            self.lines.append("ERROR: %s" % self.error)
+            self._emit('error', self.error)
+
+    def _emit(self, event, text):
+        if self.on_event:
+            self.on_event(event, text)
+
+    def tail(self):
+        """Return the most recent lines of build output."""
+        return '\n'.join(self.lines)
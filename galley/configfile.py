@@ -0,0 +1,164 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+"""Loading and checking galley YAML files.
+
+Nothing here talks to Docker or imports its client, so a config can be
+checked in a fraction of the time it takes to bring it up.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+
+from galley import buildcache
+from galley import fileutil
+from galley import scheduler
+from galley import specs
+from galley import template
+
+# Stand-ins for what Galley only learns once a resource's container
+# exists, which templates may still refer to.
+RUNTIME_VALUES = {
+    'container': '0' * 64,
+    'daemon': 0,
+    'host': {'ip': '0.0.0.0'},
+}
+HOST_PORTS = ("{{random_port}}", "{{auto_port}}")
+# Parsed configs kept in the cache; the least recently written go first.
+MAX_CACHED = 32
+
+
+def cache_path(digest):
+    return os.path.join(buildcache.cache_dir(), 'configs',
+                        digest + '.pickle')
+
+
+def parse(text):
+    """Parse YAML text without constructing arbitrary Python objects."""
+    # Imported here, so that loads answered from the cache skip it.
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def _store(digest, config):
+    directory = os.path.dirname(cache_path(digest))
+    try:
+        with fileutil.replacing(cache_path(digest), 'wb') as outfile:
+            pickle.dump(config, outfile, pickle.HIGHEST_PROTOCOL)
+        entries = sorted((os.path.join(directory, name)
+                          for name in os.listdir(directory)
+                          if name.endswith('.pickle')),
+                         key=os.path.getmtime)
+        for path in entries[:-MAX_CACHED]:
+            os.remove(path)
+    except (IOError, OSError) as exc:
+        # The cache only saves time, so a run never fails because of it.
+        print("Unable to cache parsed config: %s" % exc)
+
+
+def load(stream):
+    """Parse a config from an open file or a string.
+
+    Parsed configs are cached by a hash of their text, so the many Galley
+    processes of a sharded or parallel run parse a config only once.
+    """
+    text = stream.read() if hasattr(stream, 'read') else stream
+    digest = hashlib.sha1(text).hexdigest()
+    try:
+        with open(cache_path(digest), 'rb') as infile:
+            return pickle.load(infile)
+    except Exception:
+        # Missing, or written by an incompatible version.
+        pass
+    config = parse(text)
+    _store(digest, config)
+    return config
+
+
+def _resolve(value, context, path):
+    """Render value, raising if it refers to anything not in context."""
+    rendered = template.render(value, context, path)
+    for ref in template.references(value):
+        if ref.root not in context:
+            raise template.TemplateError("%s: unknown reference {{%s}}." %
+                                         (path, ref.source))
+    return rendered
+
+
+def validate(config):
+    """Check a parsed config and every reference in it.
+
+    Raises if an image, resource or daemon is malformed, if a template
+    refers to something that does not exist, or if resources depend on
+    each other in a cycle. References to values that only exist once the
+    environment is up, such as ports and container IDs, are checked
+    against stand-ins. Returns the config with environment variables
+    substituted.
+    """
+    if not isinstance(config, dict):
+        raise Exception("A galley config must be a mapping.")
+    for section in ('images', 'resources', 'testparams'):
+        if not isinstance(config.get(section) or {}, dict):
+            raise Exception("The %s section must be a mapping." % section)
+    images = config.get('images') or {}
+    resources = config.get('resources') or {}
+    testparams = config.get('testparams') or {}
+
+    names = set()
+    for index, data in images.items():
+        specs.validate_image(index, data)
+        if data['name'] in names:
+            raise Exception("Image %s: more than one image is named %s." %
+                            (index, data['name']))
+        names.add(data['name'])
+    for index, data in resources.items():
+        specs.validate(index, data)
+    scheduler.check_graph(scheduler.resource_dependencies(resources))
+
+    daemons = config.get('daemons') or []
+    if isinstance(daemons, dict):
+        daemons = [daemons[key] for key in sorted(daemons)]
+    for index, entry in enumerate(daemons):
+        if not isinstance(entry, dict) or not entry.get('url'):
+            raise Exception("Daemon %s has no url." % index)
+        specs.parse_size(entry.get('memory'))
+    specs.parse_size(config.get('snapshot_budget'))
+
+    context = {'environ': os.environ}
+    images = _resolve(images, context, 'images')
+    testparams = _resolve(testparams, context, 'testparams')
+    resources = template.render(resources, context, 'resources')
+
+    standins = dict((index, dict(RUNTIME_VALUES, **data))
+                    for index, data in resources.items())
+    image_context = dict((name, name) for name in names)
+    resource_context = {'resources': standins,
+                        'host': RUNTIME_VALUES['host']}
+    for index, data in resources.items():
+        for key, value in data.items():
+            path = 'resources.%s.%s' % (index, key)
+            if key == 'image':
+                _resolve(value, image_context, path)
+            elif key != 'host_port' or value not in HOST_PORTS:
+                _resolve(value, resource_context, path)
+
+    resolved = dict(config)
+    resolved['images'] = images
+    resolved['resources'] = resources
+    resolved['testparams'] = testparams
+    return resolved
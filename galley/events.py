@@ -0,0 +1,129 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import socket
+import threading
+
+from galley import jsonstream
+
+# How long to wait for the daemon to accept the subscription.
+SUBSCRIBE_TIMEOUT = 5
+
+RUNNING = ('start', 'restart', 'unpause')
+STOPPED = ('die', 'stop')
+DESTROYED = ('destroy',)
+
+
+def _chunks(fileobj):
+    """Yield the body chunks of a chunked HTTP response, as they arrive."""
+    while True:
+        size = fileobj.readline()
+        if not size:
+            return
+        size = size.strip()
+        if not size:
+            continue
+        size = int(size.split(';')[0], 16)
+        if size == 0:
+            return
+        data = fileobj.read(size)
+        fileobj.readline()
+        yield data
+
+
+def decode(chunks):
+    """Yield each JSON event, however the stream's chunks split them."""
+    decoder = jsonstream.Decoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+
+
+def apply(state, event):
+    """Update a DaemonState with one event from the daemon."""
+    status = event.get('status')
+    container = event.get('id')
+    if not container:
+        return
+    if status == 'create':
+        state.add_container(container)
+    elif status in RUNNING:
+        state.add_container(container, running=True)
+    elif status in STOPPED:
+        state.set_running(container, False)
+    elif status in DESTROYED:
+        state.remove_container(container)
+
+
+class EventWatcher(object):
+    """Keeps a DaemonState current from the daemon's /events stream.
+
+    The stream is read on a background thread with its own client, since a
+    subscription holds its connection open for as long as it lasts.
+    Operations can then wait on the state (DaemonState.wait) instead of
+    asking the daemon whether their change has happened yet.
+    """
+
+    def __init__(self, state, connect):
+        self.state = state
+        self._connect = connect
+        self._socket = None
+        self._thread = None
+        self._subscribed = threading.Event()
+        self._running = False
+        self._stopping = False
+        self.error = None
+
+    def start(self, timeout=SUBSCRIBE_TIMEOUT):
+        """Subscribe in the background; return whether it succeeded."""
+        self._thread = threading.Thread(target=self._run,
+                                        name='galley-events')
+        self._thread.daemon = True
+        self._thread.start()
+        self._subscribed.wait(timeout)
+        return self.alive()
+
+    def alive(self):
+        """Whether the state is currently being kept up to date."""
+        return self._running
+
+    def stop(self):
+        self._stopping = True
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        if self._thread is not None:
+            self._thread.join(SUBSCRIBE_TIMEOUT)
+
+    def _run(self):
+        try:
+            c = self._connect()
+            response = c.get(c._url('/events'), stream=True)
+            c._raise_for_status(response)
+            self._socket = c._get_raw_response_socket(response)
+            # The stream is quiet whenever nothing happens.
+            self._socket.settimeout(None)
+            self._running = True
+            self._subscribed.set()
+            for event in decode(_chunks(self._socket.makefile('rb'))):
+                apply(self.state, event)
+        except Exception as exc:
+            if not self._stopping:
+                self.error = exc
+        finally:
+            self._running = False
+            self._subscribed.set()
+            # Wake waiters so they notice the stream is gone.
+            self.state.notify()
@@ -0,0 +1,59 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import contextlib
+import json
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def replacing(path, mode='w', permissions=None):
+    """Yield a file whose contents replace path when the block ends.
+
+    The file is written beside path and renamed over it, so concurrent
+    readers see the old contents or the new, never part of them. If the
+    block raises, path is left as it was and the new file is removed.
+    The new file is readable only by its owner unless permissions is given.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    try:
+        if permissions is not None:
+            os.fchmod(fd, permissions)
+        with os.fdopen(fd, mode) as outfile:
+            yield outfile
+        os.rename(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path):
+    """Return the JSON object in path, or {} if it is missing or corrupt."""
+    try:
+        with open(path) as infile:
+            return json.load(infile)
+    except (IOError, ValueError):
+        return {}
+
+
+def write_json(path, data, permissions=None):
+    """Replace path with data as JSON; see replacing."""
+    with replacing(path, permissions=permissions) as outfile:
+        json.dump(data, outfile, indent=2, sort_keys=True)
@@ -0,0 +1,60 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+
+# Undecodable text without a line break is dropped past this length.
+MAX_PENDING = 1024 * 1024
+
+
+class Decoder(object):
+    """Incrementally decodes a stream of JSON messages, such as the daemon
+    sends for builds and events.
+
+    Chunks may split a message, or hold several; only the undecoded
+    remainder is buffered. The daemon ends each message with a line
+    break, so a line that does not decode is handed to on_invalid, if
+    given, and skipped rather than waited on.
+    """
+
+    def __init__(self, on_invalid=None):
+        self.on_invalid = on_invalid
+        self._buffer = ''
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk):
+        """Yield every message completed by chunk, in order."""
+        buf = self._buffer + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos == len(buf):
+                break
+            try:
+                msg, end = self._decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = buf.find('\n', pos)
+                if end == -1 and len(buf) - pos <= MAX_PENDING:
+                    # Incomplete message; wait for the next chunk.
+                    break
+                end = len(buf) if end == -1 else end + 1
+                text, pos = buf[pos:end], end
+                self._buffer = buf[pos:]
+                if self.on_invalid:
+                    self.on_invalid(text)
+                continue
+            pos = end
+            self._buffer = buf[pos:]
+            yield msg
+        self._buffer = buf[pos:]
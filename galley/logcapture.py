@@ -0,0 +1,171 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import collections
+import errno
+import os
+import select
+import socket
+import struct
+import threading
+
+DEFAULT_MAX_LINES = 200
+# Lines of each container's output shown when tests fail.
+DEFAULT_LOG_LINES = 50
+# Longer lines are cut, so a buffer never holds more than
+# max_lines * MAX_LINE_LENGTH bytes.
+MAX_LINE_LENGTH = 4096
+HEADER = struct.Struct('>BxxxI')
+STREAMS = {1: 'stdout', 2: 'stderr'}
+
+
+class LogBuffer(object):
+    """The last max_lines lines a container wrote, oldest first."""
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        self.lines = collections.deque(maxlen=max_lines)
+        self._partial = {}
+
+    def write(self, stream, data):
+        text = self._partial.pop(stream, '') + data
+        lines = text.split('\n')
+        for line in lines[:-1]:
+            self.lines.append((stream, line[:MAX_LINE_LENGTH]))
+        if lines[-1]:
+            self._partial[stream] = lines[-1][:MAX_LINE_LENGTH]
+
+    def tail(self, count=None):
+        """Return up to count of the latest (stream, line) pairs."""
+        lines = list(self.lines)
+        for stream, line in sorted(self._partial.items()):
+            lines.append((stream, line))
+        if count is not None:
+            lines = lines[-count:] if count else []
+        return lines
+
+
+class Demultiplexer(object):
+    """Splits an attach stream into its stdout and stderr frames.
+
+    Without a TTY, the daemon sends each write as an 8 byte header (stream
+    type, three zero bytes, big-endian length) followed by the data. Reads
+    may end anywhere in a frame; only the incomplete frame is buffered.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self._buffer = ''
+
+    def feed(self, data):
+        buf = self._buffer + data
+        pos = 0
+        while len(buf) - pos >= HEADER.size:
+            kind, length = HEADER.unpack_from(buf, pos)
+            end = pos + HEADER.size + length
+            if len(buf) < end:
+                break
+            self.write(STREAMS.get(kind, 'stdout'),
+                       buf[pos + HEADER.size:end])
+            pos = end
+        self._buffer = buf[pos:]
+
+
+class LogCapture(object):
+    """Streams the output of many containers on a single thread.
+
+    Each container's attach socket is added under a label; one thread
+    waits on every socket with select and files what arrives into that
+    label's LogBuffer.
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        self.max_lines = max_lines
+        self.buffers = collections.OrderedDict()
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = None
+        self._stopping = False
+
+    def add(self, label, sock, owner=None):
+        """Capture sock's output as label.
+
+        owner, such as the client the socket came from, is kept alive for
+        as long as the socket is read.
+        """
+        sock.setblocking(0)
+        with self._lock:
+            log = self.buffers.setdefault(label, LogBuffer(self.max_lines))
+            self._streams[sock] = (Demultiplexer(log.write), owner)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='galley-logs')
+                self._thread.daemon = True
+                self._thread.start()
+        os.write(self._wake_write, 'x')
+
+    def tail(self, label, count=None):
+        with self._lock:
+            log = self.buffers.get(label)
+            return log.tail(count) if log else []
+
+    def dump(self, count=None):
+        """Print the latest count lines of every container's output."""
+        with self._lock:
+            labels = list(self.buffers)
+        for label in labels:
+            lines = self.tail(label, count)
+            print("\n==> Output of %s (last %d lines) <==" %
+                  (label, len(lines)))
+            for stream, line in lines:
+                if stream == 'stderr':
+                    print("[stderr] %s" % line)
+                else:
+                    print(line)
+
+    def stop(self):
+        self._stopping = True
+        os.write(self._wake_write, 'x')
+        if self._thread is not None:
+            self._thread.join(5)
+        with self._lock:
+            for sock in self._streams:
+                sock.close()
+            self._streams.clear()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+    def _run(self):
+        while not self._stopping:
+            with self._lock:
+                socks = list(self._streams)
+            readable, _, _ = select.select(socks + [self._wake_read],
+                                           [], [])
+            for sock in readable:
+                if sock == self._wake_read:
+                    os.read(self._wake_read, 4096)
+                    continue
+                try:
+                    data = sock.recv(65536)
+                except socket.error as exc:
+                    if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK,
+                                     errno.EINTR):
+                        continue
+                    data = ''
+                with self._lock:
+                    if not data:
+                        # The container exited or was removed.
+                        self._streams.pop(sock, None)
+                        sock.close()
+                    else:
+                        self._streams[sock][0].feed(data)
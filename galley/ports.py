@@ -0,0 +1,125 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import contextlib
+import errno
+import fcntl
+import os
+import socket
+import tempfile
+import threading
+
+from galley import fileutil
+
+LEASE_LOCK = threading.Lock()
+
+
+# Every user's Galley processes lease ports in the same table, so the
+# directory holding it is writable by all and not sticky: the table is
+# replaced by renaming, which a sticky directory only allows its owner.
+LEASE_DIR = os.path.join(tempfile.gettempdir(), 'galley-ports')
+
+
+def lease_file():
+    """File recording which ports the host's Galley processes hold."""
+    return os.environ.get('GALLEY_PORT_LEASES',
+                          os.path.join(LEASE_DIR, 'leases.json'))
+
+
+def _open_lock(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+            os.chmod(directory, 0o777)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        # Undo the umask so other users can lock the file too.
+        os.fchmod(fd, 0o666)
+    except OSError:
+        # Only the owner can, and it already did.
+        pass
+    return os.fdopen(fd, 'r+')
+
+
+@contextlib.contextmanager
+def _leases():
+    """Yield the lease table while holding the host-wide lock on it."""
+    with LEASE_LOCK:
+        try:
+            lock = _open_lock(lease_file() + '.lock')
+        except (IOError, OSError) as exc:
+            raise Exception("Unable to lock port leases: %s. Set "
+                            "GALLEY_PORT_LEASES to a file in a directory "
+                            "every user can write to." % exc)
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                leases = fileutil.read_json(lease_file())
+                # Drop leases held by processes that have exited.
+                for port, pid in leases.items():
+                    if not _alive(pid):
+                        del leases[port]
+                yield leases
+                fileutil.write_json(lease_file(), leases, permissions=0o666)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
+    try:
+        sock.bind(('', 0))
+        return sock.getsockname()[1]
+    finally:
+        sock.close()
+
+
+def allocate(retries=10):
+    """Reserve a free ephemeral port for this process.
+
+    The port is leased until release() is called or the process exits, so
+    no other Galley process on the host (or thread in this one) is handed
+    the same port before Docker binds it.
+    """
+    with _leases() as leases:
+        for attempt in range(retries):
+            try:
+                port = _free_port()
+            except socket.error:
+                print("Unable to bind to port. Retrying...")
+                continue
+            if str(port) not in leases:
+                leases[str(port)] = os.getpid()
+                return port
+    raise Exception("Unable to select random port. Aborting.")
+
+
+def release(ports=None):
+    """Give up leased ports, or every port this process holds."""
+    pid = os.getpid()
+    with _leases() as leases:
+        for port, holder in leases.items():
+            if holder == pid and (ports is None or int(port) in ports):
+                del leases[port]
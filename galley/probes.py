@@ -0,0 +1,72 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import re
+import socket
+import subprocess
+import time
+import urllib2
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_INTERVAL = 0.1
+DEFAULT_MAX_INTERVAL = 5.0
+
+
+def poll(check, timeout=DEFAULT_TIMEOUT, interval=DEFAULT_INTERVAL,
+         max_interval=DEFAULT_MAX_INTERVAL):
+    """Call check until it returns True, backing off exponentially.
+
+    Exceptions raised by check count as failed attempts. Returns the number
+    of seconds waited, or None if the deadline passed first.
+    """
+    started = time.time()
+    deadline = started + timeout
+    while True:
+        try:
+            if check():
+                return time.time() - started
+        except Exception:
+            pass
+        now = time.time()
+        if now >= deadline:
+            return None
+        time.sleep(min(interval, deadline - now))
+        interval = min(interval * 2, max_interval)
+
+
+def tcp(host, port, timeout=2):
+    """Check that a TCP connection to host:port can be opened."""
+    sock = socket.create_connection((host, int(port)), timeout)
+    sock.close()
+    return True
+
+
+def http(url, timeout=2):
+    """Check that a GET request to url returns a 2xx status."""
+    response = urllib2.urlopen(url, timeout=timeout)
+    try:
+        return 200 <= response.getcode() < 300
+    finally:
+        response.close()
+
+
+def log(read_logs, pattern):
+    """Check that the text returned by read_logs matches pattern."""
+    return re.search(pattern, read_logs(), re.MULTILINE) is not None
+
+
+def command(argv):
+    """Check that argv exits with status 0."""
+    with open(os.devnull, 'w') as devnull:
+        return subprocess.call(argv, stdout=devnull, stderr=devnull) == 0
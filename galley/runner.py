@@ -0,0 +1,208 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import cPickle as pickle
+import multiprocessing
+import os
+import StringIO
+import tempfile
+import time
+import unittest
+
+import galley
+from galley import timing
+
+
+class Results(object):
+    """Test results merged from several runs.
+
+    Has the parts of unittest.TestResult that run_tests reports on.
+    Failures and errors are (test description, traceback) pairs.
+    """
+
+    def __init__(self):
+        self.testsRun = 0
+        self.failures = []
+        self.errors = []
+
+    def add(self, outcome):
+        self.testsRun += outcome['run']
+        self.failures.extend(outcome['failures'])
+        self.errors.extend(outcome['errors'])
+
+    def wasSuccessful(self):
+        return not (self.failures or self.errors)
+
+
+class TimedTextTestResult(unittest.TextTestResult):
+    """A TextTestResult that records a timing span for each test class."""
+
+    def __init__(self, *args, **kwargs):
+        super(TimedTextTestResult, self).__init__(*args, **kwargs)
+        self._class = None
+        self._class_started = None
+
+    def _finish_class(self):
+        if self._class is not None:
+            timing.record(class_name(self._class), 'test',
+                          self._class_started,
+                          time.time() - self._class_started)
+            self._class = None
+
+    def startTest(self, test):
+        if test.__class__ is not self._class:
+            self._finish_class()
+            self._class = test.__class__
+            self._class_started = time.time()
+        super(TimedTextTestResult, self).startTest(test)
+
+    def stopTestRun(self):
+        self._finish_class()
+        super(TimedTextTestResult, self).stopTestRun()
+
+
+def _flatten(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for t in _flatten(test):
+                yield t
+        else:
+            yield test
+
+
+def test_classes(suite):
+    """Return the test classes in suite, in order and without repeats."""
+    classes = []
+    for test in _flatten(suite):
+        if test.__class__ not in classes:
+            classes.append(test.__class__)
+    return classes
+
+
+def class_name(cls):
+    return "%s.%s" % (cls.__module__, cls.__name__)
+
+
+def is_serial(cls):
+    """Whether a test class must run in the parent process.
+
+    Classes opt in by setting serial = True. Placeholders for modules that
+    failed to import cannot be loaded by name, so they run there too.
+    """
+    return (getattr(cls, 'serial', False) or
+            cls.__module__ == 'unittest.loader')
+
+
+def write_environment(environment):
+    """Serialize environment to a file that worker processes can load."""
+    fd, path = tempfile.mkstemp(prefix='galley-env-', suffix='.pickle')
+    with os.fdopen(fd, 'wb') as outfile:
+        pickle.dump(environment, outfile, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _use_environment(path):
+    if os.environ.get(galley.ENVIRONMENT_FILE) != path:
+        os.environ[galley.ENVIRONMENT_FILE] = path
+        galley.GALLEYENV = None
+        galley.get_environment()
+
+
+def run_suite(suite):
+    """Run suite and return its outcome as picklable data."""
+    stream = StringIO.StringIO()
+    result = TimedTextTestResult(
+        unittest.runner._WritelnDecorator(stream), True, 1)
+    recorded = len(timing.spans())
+    result.startTestRun()
+    suite.run(result)
+    result.stopTestRun()
+    result.printErrors()
+    return {
+        'run': result.testsRun,
+        'failures': [(str(t), tb) for t, tb in result.failures],
+        'errors': [(str(t), tb) for t, tb in result.errors],
+        'output': stream.getvalue(),
+        'spans': timing.spans()[recorded:],
+    }
+
+
+def _run_classes(task):
+    """Run test classes, by name, one after another in one environment."""
+    names, path = task
+    _use_environment(path)
+    loader = unittest.TestLoader()
+    return [(name, run_suite(loader.loadTestsFromName(name)))
+            for name in names]
+
+
+def run_parallel(suite, environments, workers=None):
+    """Spread the test classes in suite across worker processes.
+
+    With one environment, classes are handed out one at a time to workers
+    processes. With several (one per shard), the classes are split into
+    that many partitions, and each partition runs in its own process
+    against its own environment. Workers load their environment through
+    galley.get_environment. Classes marked serial run in this process,
+    against the first environment, once the others are done. Prints output
+    like unittest's TextTestRunner and returns merged Results.
+    """
+    started = time.time()
+    classes = test_classes(suite)
+    parallel = [class_name(cls) for cls in classes if not is_serial(cls)]
+    serial = [cls for cls in classes if is_serial(cls)]
+
+    paths = [write_environment(env) for env in environments]
+    if len(paths) == 1:
+        tasks = [([name], paths[0]) for name in parallel]
+    else:
+        tasks = [(parallel[n::len(paths)], path)
+                 for n, path in enumerate(paths)]
+        workers = len(paths)
+    outcomes = {}
+    try:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for done in pool.imap_unordered(_run_classes, tasks):
+                outcomes.update(done)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for path in paths:
+            os.remove(path)
+
+    results = Results()
+    output = []
+    for name in parallel:
+        results.add(outcomes[name])
+        output.append(outcomes[name]['output'])
+        timing.extend(outcomes[name]['spans'])
+    for cls in serial:
+        outcome = run_suite(unittest.TestSuite(
+            t for t in _flatten(suite) if t.__class__ is cls))
+        results.add(outcome)
+        output.append(outcome['output'])
+
+    elapsed = time.time() - started
+    print(''.join(output))
+    print(unittest.TextTestResult.separator2)
+    print("Ran %d test%s in %.3fs\n" % (results.testsRun,
+                                        results.testsRun != 1 and "s" or "",
+                                        elapsed))
+    if results.wasSuccessful():
+        print("OK")
+    else:
+        print("FAILED (failures=%d, errors=%d)" % (len(results.failures),
+                                                   len(results.errors)))
+    return results
@@ -0,0 +1,128 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+from galley import template
+
+DEFAULT_WORKERS = 8
+# Pulls are network bound and builds CPU bound, so each gets its own limit.
+DEFAULT_PULL_WORKERS = 4
+DEFAULT_BUILD_WORKERS = 2
+
+
+def resource_key(resources, ref):
+    """Map a reference (index or resource name) to its resources key."""
+    for key, data in resources.items():
+        if str(key) == str(ref):
+            return key
+    for key, data in resources.items():
+        if data.get('name') == ref:
+            return key
+    raise Exception("Unknown resource reference: %s" % ref)
+
+
+def referenced_resources(resources, value):
+    """Return the keys of the resources referenced anywhere in value."""
+    return set(resource_key(resources, ref.keys[0])
+               for ref in template.references(value)
+               if ref.root == 'resources' and ref.keys)
+
+
+def resource_dependencies(resources):
+    """Return a dict mapping each resource key to the keys it depends on.
+
+    Dependencies come from {{resources[N]...}} references anywhere in a
+    resource definition and from its optional 'depends_on' list, which may
+    name resources by key or by name.
+    """
+    dependencies = {}
+    for key, data in resources.items():
+        depends_on = data.get('depends_on') or []
+        if not isinstance(depends_on, (list, tuple)):
+            depends_on = [depends_on]
+        deps = referenced_resources(resources, data)
+        deps.update(resource_key(resources, ref) for ref in depends_on)
+        deps.discard(key)
+        dependencies[key] = deps
+    return dependencies
+
+
+def check_graph(dependencies):
+    """Raise if dependencies reference unknown nodes or contain a cycle."""
+    for node, deps in dependencies.items():
+        for dep in deps:
+            if dep not in dependencies:
+                raise Exception("%s depends on unknown node %s." % (node, dep))
+    remaining = dict((n, set(d)) for n, d in dependencies.items())
+    while remaining:
+        ready = [n for n, d in remaining.items() if not d]
+        if not ready:
+            raise Exception("Dependency cycle between: %s" %
+                            ", ".join(str(n) for n in sorted(remaining)))
+        for node in ready:
+            del remaining[node]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_graph(dependencies, func, max_workers=DEFAULT_WORKERS,
+              stop_on_error=True, kind=None, limits=None):
+    """Call func(node) for every node once all its dependencies are done.
+
+    Nodes whose dependencies have finished run at the same time on a pool
+    of at most max_workers threads. If kind maps a node to a category,
+    limits can cap how many nodes of each category run at once. Returns a
+    (results, errors) pair of dicts keyed by node. Dependents of a failed
+    node are never run; with stop_on_error, no new nodes are started after
+    the first failure.
+    """
+    # The futures backport loads multiprocessing, so it is only imported
+    # by the commands that run a graph.
+    from concurrent import futures
+
+    check_graph(dependencies)
+    limits = limits or {}
+    kind = kind or (lambda node: None)
+    results = {}
+    errors = {}
+    pending = dict((n, set(d)) for n, d in dependencies.items())
+    running = {}
+
+    def has_capacity(node):
+        limit = limits.get(kind(node))
+        if limit is None:
+            return True
+        busy = sum(1 for n in running.values() if kind(n) == kind(node))
+        return busy < max(1, limit)
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while pending or running:
+            if not (stop_on_error and errors):
+                for node in sorted(n for n, d in pending.items() if not d):
+                    if has_capacity(node):
+                        del pending[node]
+                        running[pool.submit(func, node)] = node
+            if not running:
+                break
+            done, _ = futures.wait(list(running),
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    results[node] = future.result()
+                except (Exception, SystemExit) as exc:
+                    errors[node] = exc
+                    continue
+                for deps in pending.values():
+                    deps.discard(node)
+
+    return results, errors
@@ -16,16 +16,18 @@ import sys
 #   under the License.
 #
 
-import yaml
+from galley import logcapture
+from galley import scheduler
+from galley import specs
+from galley import statefile
+from galley import timing
 
-from galley import builder
+# Commands import galley.builder, and with it the Docker client, and
+# galley.configfile, and with it yaml, only once their arguments are
+# parsed, so that -h and validate start quickly.
 
 
-def main(argv=sys.argv[1:]):
-    """Start galley command-line tool."""
-
-    description = 'End-to-end testing orchestration with Docker.'
-    parser = argparse.ArgumentParser(description=description)
+def add_config_argument(parser):
     parser.add_argument(
         'config',
         nargs='?',
@@ -33,6 +35,168 @@ def main(argv=sys.argv[1:]):
         help='Path to galley YAML file that defines Docker resources.',
         default=os.path.join(os.getcwd(), '.galley.yml'),
     )
+
+
+def add_concurrency_arguments(parser):
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        help='Maximum number of resources to bring up at the same time.',
+        dest='concurrency',
+        default=scheduler.DEFAULT_WORKERS,
+    )
+    parser.add_argument(
+        '--pull-concurrency',
+        type=int,
+        help='Maximum number of images to pull at the same time.',
+        dest='pull_concurrency',
+        default=scheduler.DEFAULT_PULL_WORKERS,
+    )
+    parser.add_argument(
+        '--build-concurrency',
+        type=int,
+        help='Maximum number of images to build at the same time.',
+        dest='build_concurrency',
+        default=scheduler.DEFAULT_BUILD_WORKERS,
+    )
+
+
+def add_state_file_argument(parser):
+    parser.add_argument(
+        '--state-file',
+        help='File recording the containers of the environment.',
+        dest='state_file',
+        default=statefile.DEFAULT_PATH,
+    )
+
+
+def up(argv):
+    """Bring an environment up, changing only what differs."""
+
+    description = ('Bring up the resources in a galley YAML file and leave '
+                   'them running. Containers recorded in the state file '
+                   'are kept if their definition is unchanged, replaced if '
+                   'it changed, and removed if they are no longer '
+                   'configured.')
+    parser = argparse.ArgumentParser(prog='galley up',
+                                     description=description)
+    add_config_argument(parser)
+    add_state_file_argument(parser)
+    add_concurrency_arguments(parser)
+    parser.add_argument(
+        '--shards',
+        type=int,
+        help='Number of independent copies of the resources to build.',
+        dest='shards',
+        default=1,
+    )
+    args = parser.parse_args(argv)
+
+    from galley import builder
+    from galley import configfile
+    config = configfile.load(args.config)
+    builder.up(config, args.state_file,
+               concurrency=args.concurrency,
+               pull_concurrency=args.pull_concurrency,
+               build_concurrency=args.build_concurrency,
+               shards=args.shards)
+
+
+def down(argv):
+    """Remove the containers brought up by galley up."""
+
+    description = 'Remove every container recorded in the state file.'
+    parser = argparse.ArgumentParser(prog='galley down',
+                                     description=description)
+    add_state_file_argument(parser)
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        help='Maximum number of containers to remove at the same time.',
+        dest='concurrency',
+        default=scheduler.DEFAULT_WORKERS,
+    )
+    args = parser.parse_args(argv)
+
+    from galley import builder
+    failures = builder.down(args.state_file, concurrency=args.concurrency)
+    sys.exit(1 if failures else 0)
+
+
+def prefetch(argv):
+    """Pull the images in a config ahead of a run."""
+
+    description = ('Pull every image in a galley YAML file onto every '
+                   'daemon it lists, following each image\'s pull_policy.')
+    parser = argparse.ArgumentParser(prog='galley prefetch',
+                                     description=description)
+    add_config_argument(parser)
+    parser.add_argument(
+        '--pull-concurrency',
+        type=int,
+        help='Maximum number of images to pull at the same time.',
+        dest='pull_concurrency',
+        default=scheduler.DEFAULT_PULL_WORKERS,
+    )
+    parser.add_argument(
+        '--pull-policy',
+        choices=specs.PULL_POLICIES,
+        help='Pull policy to use for every image instead of its own.',
+        dest='pull_policy',
+        default=None,
+    )
+    args = parser.parse_args(argv)
+
+    from galley import builder
+    from galley import configfile
+    config = configfile.load(args.config)
+    failures = builder.prefetch(config,
+                                pull_concurrency=args.pull_concurrency,
+                                policy=args.pull_policy)
+    sys.exit(1 if failures else 0)
+
+
+def validate(argv):
+    """Check a config without talking to Docker."""
+
+    description = ('Check that a galley YAML file is well formed and that '
+                   'every reference in it resolves, without talking to '
+                   'Docker. Exits with status 1 if it is not.')
+    parser = argparse.ArgumentParser(prog='galley validate',
+                                     description=description)
+    add_config_argument(parser)
+    args = parser.parse_args(argv)
+
+    from galley import configfile
+    try:
+        config = configfile.validate(configfile.load(args.config))
+    except Exception as exc:
+        print("%s: %s" % (args.config.name, exc))
+        sys.exit(1)
+    print("%s: OK (%d images, %d resources)." % (
+        args.config.name, len(config['images']), len(config['resources'])))
+
+
+# Subcommands, by the first argument that selects them.
+COMMANDS = {
+    'down': down,
+    'prefetch': prefetch,
+    'up': up,
+    'validate': validate,
+}
+
+
+def main(argv=sys.argv[1:]):
+    """Start galley command-line tool."""
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+
+    description = ('End-to-end testing orchestration with Docker. '
+                   'Run "galley up -h", "galley down -h", '
+                   '"galley prefetch -h" or "galley validate -h" for the '
+                   'other commands.')
+    parser = argparse.ArgumentParser(description=description)
+    add_config_argument(parser)
     parser.add_argument(
         'pattern',
         nargs='?',
@@ -46,7 +210,63 @@ def main(argv=sys.argv[1:]):
         dest='nodestroy',
         default=False,
     )
-    args = parser.parse_args()
+    add_concurrency_arguments(parser)
+    parser.add_argument(
+        '--reuse',
+        action='store_true',
+        help='Reuse matching containers left running by an earlier run, '
+             'and leave them running afterwards.',
+        dest='reuse',
+        default=False,
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Number of processes to spread test classes across.',
+        dest='workers',
+        default=1,
+    )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        help='Number of independent copies of the resources to build, '
+             'each running its own share of the test classes.',
+        dest='shards',
+        default=1,
+    )
+    parser.add_argument(
+        '--log-lines',
+        type=int,
+        help='Lines of each container\'s output to show when tests fail '
+             '(0 to not capture output).',
+        dest='log_lines',
+        default=logcapture.DEFAULT_LOG_LINES,
+    )
+    parser.add_argument(
+        '--profile',
+        help='Write the timing of every operation to this file.',
+        dest='profile',
+        default=None,
+    )
+    parser.add_argument(
+        '--profile-format',
+        choices=timing.FORMATS,
+        help='Format of the --profile file.',
+        dest='profile_format',
+        default='json',
+    )
+    args = parser.parse_args(argv)
 
-    config = yaml.load(args.config)
-    builder.run_tests(config, args.pattern, args.nodestroy)
+    from galley import builder
+    from galley import configfile
+    config = configfile.load(args.config)
+    builder.run_tests(config, args.pattern, args.nodestroy,
+                      concurrency=args.concurrency,
+                      pull_concurrency=args.pull_concurrency,
+                      build_concurrency=args.build_concurrency,
+                      reuse=args.reuse,
+                      workers=args.workers,
+                      shards=args.shards,
+                      profile=args.profile,
+                      profile_format=args.profile_format,
+                      log_lines=args.log_lines)
@@ -0,0 +1,100 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from galley import buildcache
+from galley import fileutil
+
+DEFAULT_BUDGET = '10g'
+REPOSITORY = 'galley-snapshot/%s'
+
+INDEX_LOCK = threading.Lock()
+
+
+def index_path():
+    return os.path.join(buildcache.cache_dir(), 'snapshots.json')
+
+
+def repository(name):
+    """The repository a resource's snapshots are tagged in."""
+    return REPOSITORY % re.sub('[^a-z0-9_.-]', '_', str(name).lower())
+
+
+def snapshot_key(fingerprint, seed=None, seed_files=()):
+    """Hash what a seeded container's state depends on.
+
+    That is its resource fingerprint, its seed command and the contents of
+    its seed files, so editing any of them makes a new snapshot.
+    """
+    digest = hashlib.sha1()
+    digest.update(fingerprint)
+    digest.update(json.dumps(seed))
+    for path in seed_files or ():
+        digest.update('\0' + path + '\0')
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(65536), ''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _entry_key(image, daemon):
+    return "%s@%s" % (image, daemon or '')
+
+
+def touch(image, daemon=None, size=None):
+    """Record that a snapshot was made or used just now."""
+    with INDEX_LOCK:
+        index = fileutil.read_json(index_path())
+        entry = index.setdefault(_entry_key(image, daemon),
+                                 {'image': image, 'daemon': daemon,
+                                  'size': 0})
+        if size is not None:
+            entry['size'] = size
+        entry['last_used'] = time.time()
+        fileutil.write_json(index_path(), index)
+
+
+def forget(image, daemon=None):
+    with INDEX_LOCK:
+        index = fileutil.read_json(index_path())
+        if index.pop(_entry_key(image, daemon), None) is not None:
+            fileutil.write_json(index_path(), index)
+
+
+def evictable(budget, keep=()):
+    """Return the (image, daemon) pairs to remove to get under budget.
+
+    budget is in bytes and covers the snapshots of every daemon together.
+    The least recently used are chosen first; those in keep (pairs in use
+    by this run) never are.
+    """
+    with INDEX_LOCK:
+        entries = sorted(fileutil.read_json(index_path()).values(),
+                         key=lambda e: e.get('last_used', 0))
+    total = sum(e.get('size', 0) for e in entries)
+    evict = []
+    for entry in entries:
+        if total <= budget:
+            break
+        pair = (entry['image'], entry['daemon'])
+        if pair in keep:
+            continue
+        evict.append(pair)
+        total -= entry.get('size', 0)
+    return evict
@@ -0,0 +1,194 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import re
+
+PORT = re.compile(r'^\d+(/(tcp|udp))?$')
+SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)b?\s*$')
+
+ACTIONS = ('pull', 'build')
+PULL_POLICIES = ('always', 'if-not-present', 'never')
+
+
+def parse_size(value):
+    """Convert a size such as 512m or 2g, or a number of bytes, to bytes."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = SIZE.match(str(value).lower())
+    if not match:
+        raise Exception("Cannot parse size: %s" % value)
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** 'bkmgt'.index(unit or 'b'))
+
+
+def _templated(value):
+    return isinstance(value, basestring) and '{{' in value
+
+
+def pull_policy(data):
+    """Return the pull policy of an image definition.
+
+    Without one, images tagged latest, or not tagged at all, are pulled
+    every run, since the tag moves; others only when missing.
+    """
+    if data.get('pull_policy'):
+        return data['pull_policy']
+    if (data.get('tag') or 'latest') == 'latest':
+        return 'always'
+    return 'if-not-present'
+
+
+def validate_image(index, data):
+    """Raise if an image definition cannot be pulled or built."""
+    where = "Image %s" % index
+    if not isinstance(data, dict):
+        raise Exception("%s must be a mapping." % where)
+    for key in ('name', 'source'):
+        if not data.get(key):
+            raise Exception("%s has no %s." % (where, key))
+    if data.get('action') not in ACTIONS:
+        raise Exception("%s: action must be one of %s, not %r." %
+                        (where, ', '.join(ACTIONS), data.get('action')))
+    policy = pull_policy(data)
+    if policy not in PULL_POLICIES and not _templated(policy):
+        raise Exception("%s: pull_policy must be one of %s, not %r." %
+                        (where, ', '.join(PULL_POLICIES), policy))
+
+
+def validate(index, data):
+    """Raise if a resource definition cannot describe a container.
+
+    Values that are still templates are checked once rendered, when the
+    resource is compiled into a ContainerSpec.
+    """
+    where = "Resource %s" % index
+    if not isinstance(data, dict):
+        raise Exception("%s must be a mapping." % where)
+    if not data.get('image'):
+        raise Exception("%s has no image." % where)
+    for key in ('cont_port', 'host_port'):
+        value = data.get(key)
+        if value is not None and not _templated(value) and \
+                not PORT.match(str(value)):
+            raise Exception("%s: %s must be a port number, not %r." %
+                            (where, key, value))
+    if 'host_port' in data and 'cont_port' not in data:
+        raise Exception("%s has a host_port but no cont_port." % where)
+    if 'host_volume' in data and 'cont_volume' not in data:
+        raise Exception("%s has a host_volume but no cont_volume." % where)
+    if not _templated(data.get('mem_limit')):
+        try:
+            parse_size(data.get('mem_limit'))
+        except Exception as exc:
+            raise Exception("%s: mem_limit: %s" % (where, exc))
+    cpu_shares = data.get('cpu_shares')
+    if cpu_shares is not None and not _templated(cpu_shares) and \
+            not str(cpu_shares).isdigit():
+        raise Exception("%s: cpu_shares must be a whole number, not %r." %
+                        (where, cpu_shares))
+    environment = data.get('environment')
+    if environment is not None and not isinstance(environment,
+                                                  (dict, list)):
+        raise Exception("%s: environment must be a mapping or a list." %
+                        where)
+    for key in ('command', 'entrypoint', 'seed'):
+        value = data.get(key)
+        if value is not None and not isinstance(value, (basestring, list)):
+            raise Exception("%s: %s must be a string or a list." %
+                            (where, key))
+    seed_files = data.get('seed_files')
+    if seed_files is not None:
+        if not isinstance(seed_files, list):
+            raise Exception("%s: seed_files must be a list." % where)
+        for path in seed_files:
+            if not _templated(path) and not os.path.isfile(path):
+                raise Exception("%s: seed file %s does not exist." %
+                                (where, path))
+
+
+class ContainerSpec(object):
+    """The options a resource's container is created and started with."""
+
+    __slots__ = ('image', 'name', 'command', 'entrypoint', 'environment',
+                 'hostname', 'working_dir', 'mem_limit', 'cpu_shares',
+                 'ports', 'volumes', 'port_bindings', 'binds')
+
+    def __init__(self, image, name=None, command=None, entrypoint=None,
+                 environment=None, hostname=None, working_dir=None,
+                 mem_limit=0, cpu_shares=None, ports=None, volumes=None,
+                 port_bindings=None, binds=None):
+        self.image = image
+        self.name = name
+        self.command = command
+        self.entrypoint = entrypoint
+        self.environment = environment
+        self.hostname = hostname
+        self.working_dir = working_dir
+        self.mem_limit = mem_limit
+        self.cpu_shares = cpu_shares
+        self.ports = ports
+        self.volumes = volumes
+        self.port_bindings = port_bindings
+        self.binds = binds
+
+    @classmethod
+    def from_resource(cls, data, name=None):
+        """Compile a rendered resource definition.
+
+        A host_port of {{auto_port}} binds the container port to a port
+        Docker chooses.
+        """
+        cont_port = data.get('cont_port')
+        host_port = data.get('host_port')
+        cont_volume = data.get('cont_volume')
+        port_bindings = None
+        if cont_port is not None and host_port is not None:
+            if host_port == "{{auto_port}}":
+                port_bindings = {cont_port: None}
+            else:
+                port_bindings = {cont_port: host_port}
+        binds = None
+        if data.get('host_volume') and cont_volume:
+            binds = {os.path.abspath(data['host_volume']): cont_volume}
+        cpu_shares = data.get('cpu_shares')
+        return cls(
+            image=data['image'],
+            name=name,
+            command=data.get('command'),
+            entrypoint=data.get('entrypoint'),
+            environment=data.get('environment'),
+            hostname=data.get('hostname'),
+            working_dir=data.get('working_dir'),
+            mem_limit=parse_size(data.get('mem_limit')) or 0,
+            cpu_shares=int(cpu_shares) if cpu_shares is not None else None,
+            ports=[cont_port] if cont_port is not None else None,
+            volumes=[cont_volume] if cont_volume else None,
+            port_bindings=port_bindings,
+            binds=binds)
+
+    def create_options(self):
+        """Keyword arguments for builder.create."""
+        return {
+            'image': self.image,
+            'name': self.name,
+            'command': self.command,
+            'entrypoint': self.entrypoint,
+            'environment': self.environment,
+            'hostname': self.hostname,
+            'working_dir': self.working_dir,
+            'mem_limit': self.mem_limit,
+            'cpu_shares': self.cpu_shares,
+            'ports': self.ports,
+            'volumes': self.volumes,
+        }
@@ -0,0 +1,156 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import threading
+import time
+
+# Some Docker-py calls return long hashes and some return short ones, so
+# everything is also indexed by its short form.
+SHORT_ID = 12
+
+
+class DaemonState(object):
+    """An indexed, in-memory snapshot of a daemon's images and containers.
+
+    The snapshot is loaded from one image listing and one container listing
+    and then kept current by Galley's own operations and the daemon's event
+    stream, so existence checks are dictionary lookups instead of daemon
+    round trips. Callers can wait for a change with wait().
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._clear()
+
+    def _clear(self):
+        self.images = {}
+        self.images_by_short_id = {}
+        self.images_by_tag = {}
+        self.containers = {}
+        self.containers_by_short_id = {}
+        self.containers_by_name = {}
+
+    def load(self, images, containers):
+        """Replace the snapshot with fresh image and container listings."""
+        with self._lock:
+            self._clear()
+            for image in images:
+                self.add_image(image['Id'], image.get('RepoTags') or [])
+            for cont in containers:
+                self.add_container(cont['Id'], cont.get('Names') or [],
+                                   running=cont.get('Status', '')
+                                   .startswith('Up'))
+            self.loaded = True
+            self._changed.notify_all()
+
+    def add_image(self, image_id, repo_tags=()):
+        with self._lock:
+            image = self.images.setdefault(image_id, {'Id': image_id,
+                                                      'RepoTags': []})
+            for repo_tag in repo_tags:
+                if repo_tag not in image['RepoTags']:
+                    image['RepoTags'].append(repo_tag)
+                self.images_by_tag[repo_tag] = image
+            self.images_by_short_id[image_id[:SHORT_ID]] = image
+            self._changed.notify_all()
+            return image
+
+    def remove_image(self, ref):
+        with self._lock:
+            image = self.find_image(ref)
+            if not image:
+                return
+            del self.images[image['Id']]
+            self.images_by_short_id.pop(image['Id'][:SHORT_ID], None)
+            for repo_tag in image['RepoTags']:
+                self.images_by_tag.pop(repo_tag, None)
+            self._changed.notify_all()
+
+    def find_image(self, ref, tag=None):
+        """Look up an image by repo and tag, repo:tag, or (short) ID."""
+        with self._lock:
+            if tag:
+                return self.images_by_tag.get("%s:%s" % (ref, tag))
+            return (self.images_by_tag.get(ref) or
+                    self.images.get(ref) or
+                    self.images_by_short_id.get(ref[:SHORT_ID]))
+
+    def add_container(self, container_id, names=(), running=False):
+        with self._lock:
+            cont = (self.containers.get(container_id) or
+                    self.containers_by_short_id.get(
+                        container_id[:SHORT_ID]))
+            if cont is None:
+                cont = self.containers[container_id] = {'Id': container_id,
+                                                        'Names': []}
+            cont['Running'] = running
+            for name in names:
+                name = name.lstrip('/')
+                if name not in cont['Names']:
+                    cont['Names'].append(name)
+                self.containers_by_name[name] = cont
+            self.containers_by_short_id[container_id[:SHORT_ID]] = cont
+            self._changed.notify_all()
+            return cont
+
+    def remove_container(self, ref):
+        with self._lock:
+            cont = self.find_container(ref)
+            if not cont:
+                return
+            del self.containers[cont['Id']]
+            self.containers_by_short_id.pop(cont['Id'][:SHORT_ID], None)
+            for name in cont['Names']:
+                self.containers_by_name.pop(name, None)
+            self._changed.notify_all()
+
+    def find_container(self, ref):
+        """Look up a container by name or (short) ID."""
+        with self._lock:
+            return (self.containers.get(ref) or
+                    self.containers_by_name.get(ref.lstrip('/')) or
+                    self.containers_by_short_id.get(ref[:SHORT_ID]))
+
+    def set_running(self, ref, running):
+        with self._lock:
+            cont = self.find_container(ref)
+            if cont:
+                cont['Running'] = running
+                self._changed.notify_all()
+
+    def is_running(self, ref):
+        with self._lock:
+            cont = self.find_container(ref)
+            return bool(cont and cont['Running'])
+
+    def notify(self):
+        """Wake every waiter so it re-checks its condition."""
+        with self._lock:
+            self._changed.notify_all()
+
+    def wait(self, predicate, timeout):
+        """Wait until predicate() holds for the snapshot.
+
+        predicate is re-checked whenever the snapshot changes. Returns
+        whether it held before timeout seconds passed.
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while not predicate():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
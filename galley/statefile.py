@@ -0,0 +1,58 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import threading
+
+from galley import fileutil
+
+DEFAULT_PATH = '.galley-state.json'
+
+
+class StateFile(object):
+    """Records which container each resource of an environment runs in.
+
+    Entries are keyed by resource name and hold the container ID, the
+    fingerprint of the definition it was created from, and the URL of its
+    daemon (None for the default one). The file is rewritten after every
+    change, so a run that dies partway leaves an accurate record.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.resources = fileutil.read_json(path).get('resources', {})
+
+    def get(self, key):
+        with self._lock:
+            return self.resources.get(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self.resources)
+
+    def set(self, key, container, fingerprint, daemon=None):
+        with self._lock:
+            self.resources[key] = {
+                'container': container,
+                'fingerprint': fingerprint,
+                'daemon': daemon,
+            }
+            self._save()
+
+    def remove(self, key):
+        with self._lock:
+            if self.resources.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        fileutil.write_json(self.path, {'resources': self.resources})
@@ -0,0 +1,169 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import re
+
+PLACEHOLDER = re.compile(r'{{(.*?)}}')
+ROOT = re.compile(r'\s*([^\[\]\s]+)\s*')
+SUBSCRIPT = re.compile(r'\[\s*(?:(-?\d+)|\'([^\']*)\'|"([^"]*)")\s*\]\s*')
+
+# Parsed templates, keyed by their source text.
+_CACHE = {}
+
+
+class TemplateError(Exception):
+    """A template could not be parsed or a reference could not be found."""
+
+
+class Reference(object):
+    """A {{root[key][key]...}} placeholder."""
+
+    __slots__ = ('source', 'root', 'keys')
+
+    def __init__(self, source, root, keys):
+        self.source = source
+        self.root = root
+        self.keys = keys
+
+    def resolve(self, context, path):
+        value = context[self.root]
+        for key in self.keys:
+            value = _lookup(value, key, self, path)
+        return value
+
+
+class Template(object):
+    """A string parsed into literal text and Reference segments."""
+
+    __slots__ = ('segments',)
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    @property
+    def references(self):
+        return [s for s in self.segments if isinstance(s, Reference)]
+
+    def render(self, context, path=''):
+        """Substitute every reference whose root is in context.
+
+        References to other roots are left as written, so a value can be
+        rendered in several passes as more of the context becomes known.
+        A template that is exactly one reference renders to the referenced
+        value itself rather than its string form.
+        """
+        if len(self.segments) == 1 and isinstance(self.segments[0],
+                                                  Reference):
+            ref = self.segments[0]
+            if ref.root in context:
+                return ref.resolve(context, path)
+        out = []
+        for segment in self.segments:
+            if not isinstance(segment, Reference):
+                out.append(segment)
+            elif segment.root in context:
+                out.append(str(segment.resolve(context, path)))
+            else:
+                out.append("{{%s}}" % segment.source)
+        return ''.join(out)
+
+
+def _lookup(value, key, ref, path):
+    try:
+        return value[key]
+    except (KeyError, IndexError, TypeError):
+        pass
+    if isinstance(value, dict):
+        # YAML may key resources by number; templates may quote it or use
+        # the resource's name instead.
+        for k, v in value.items():
+            if str(k) == str(key):
+                return v
+        for k, v in value.items():
+            if isinstance(v, dict) and v.get('name') == key:
+                return v
+    raise TemplateError("%s: {{%s}} has no %r." % (path, ref.source, key))
+
+
+def parse_reference(source):
+    """Parse the inside of a placeholder into a Reference."""
+    match = ROOT.match(source)
+    if not match:
+        raise TemplateError("Cannot parse reference {{%s}}." % source)
+    keys = []
+    pos = match.end()
+    while pos < len(source):
+        match = SUBSCRIPT.match(source, pos)
+        if not match:
+            raise TemplateError("Cannot parse reference {{%s}}." % source)
+        number, single, double = match.groups()
+        keys.append(int(number) if number is not None
+                    else single if single is not None else double)
+        pos = match.end()
+    return Reference(source.strip(), ROOT.match(source).group(1),
+                     tuple(keys))
+
+
+def compile_template(text):
+    """Parse text into a Template, reusing an earlier parse if possible."""
+    template = _CACHE.get(text)
+    if template is None:
+        segments = []
+        pos = 0
+        for match in PLACEHOLDER.finditer(text):
+            if match.start() > pos:
+                segments.append(text[pos:match.start()])
+            segments.append(parse_reference(match.group(1)))
+            pos = match.end()
+        if pos < len(text):
+            segments.append(text[pos:])
+        template = Template(segments)
+        _CACHE[text] = template
+    return template
+
+
+def render(value, context, path=''):
+    """Render every string nested anywhere inside value.
+
+    Returns a new value; dicts and lists are rebuilt rather than modified.
+    path names value in error messages.
+    """
+    if isinstance(value, dict):
+        return dict((k, render(v, context, "%s.%s" % (path, k)))
+                    for k, v in value.items())
+    if isinstance(value, list):
+        return [render(v, context, "%s[%d]" % (path, i))
+                for i, v in enumerate(value)]
+    if isinstance(value, basestring) and '{{' in value:
+        try:
+            return compile_template(value).render(context, path)
+        except TemplateError as exc:
+            if str(exc).startswith(path):
+                raise
+            raise TemplateError("%s: %s" % (path, exc))
+    return value
+
+
+def references(value):
+    """Yield every Reference nested anywhere inside value."""
+    if isinstance(value, dict):
+        for v in value.values():
+            for ref in references(v):
+                yield ref
+    elif isinstance(value, list):
+        for v in value:
+            for ref in references(v):
+                yield ref
+    elif isinstance(value, basestring) and '{{' in value:
+        for ref in compile_template(value).references:
+            yield ref
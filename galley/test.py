@@ -17,6 +17,9 @@ import galley
 
 
 class GalleyTestCase(unittest.TestCase):
+    # Set to True in test classes that must not run at the same time as
+    # others when tests are spread across workers.
+    serial = False
 
     @classmethod
     def setUpClass(cls):
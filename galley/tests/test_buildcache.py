@@ -0,0 +1,106 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from galley import buildcache
+
+
+class TestContextHash(unittest.TestCase):
+
+    def setUp(self):
+        self.context = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.context)
+        self.write('Dockerfile', 'FROM base\n')
+        self.write('app.py', 'print 1\n')
+        self.write('logs/run.log', 'started\n')
+        self.write('build/out.o', 'object\n')
+
+    def write(self, relpath, text):
+        path = os.path.join(self.context, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as outfile:
+            outfile.write(text)
+
+    def digest(self, options=None):
+        return buildcache.context_hash(self.context, options)
+
+    def test_read_dockerignore(self):
+        self.write('.dockerignore', '# comment\n\nlogs/\n*.tmp\n')
+        self.assertEqual(buildcache.read_dockerignore(self.context),
+                         ['logs', '*.tmp'])
+
+    def test_is_ignored(self):
+        patterns = ['logs', '*.tmp', 'build/*.o']
+        self.assertTrue(buildcache.is_ignored('logs', patterns))
+        self.assertTrue(buildcache.is_ignored(
+            os.path.join('logs', 'run.log'), patterns))
+        self.assertTrue(buildcache.is_ignored('a.tmp', patterns))
+        self.assertTrue(buildcache.is_ignored(
+            os.path.join('build', 'out.o'), patterns))
+        self.assertFalse(buildcache.is_ignored('app.py', patterns))
+        self.assertFalse(buildcache.is_ignored(
+            os.path.join('src', 'logs.py'), patterns))
+
+    def test_changes_to_contents_names_and_modes(self):
+        digest = self.digest()
+        self.assertEqual(self.digest(), digest)
+        self.write('app.py', 'print 2\n')
+        changed = self.digest()
+        self.assertNotEqual(changed, digest)
+        os.chmod(os.path.join(self.context, 'app.py'), 0o755)
+        self.assertNotEqual(self.digest(), changed)
+        changed = self.digest()
+        os.rename(os.path.join(self.context, 'app.py'),
+                  os.path.join(self.context, 'main.py'))
+        self.assertNotEqual(self.digest(), changed)
+
+    def test_options_count(self):
+        self.assertNotEqual(self.digest({'nocache': True}), self.digest())
+
+    def test_ignored_files_do_not_count(self):
+        self.write('.dockerignore', 'logs\nbuild/*.o\n')
+        digest = self.digest()
+        self.write('logs/run.log', 'more\n')
+        self.write('logs/new.log', 'new\n')
+        self.write('build/other.o', 'object\n')
+        self.assertEqual(self.digest(), digest)
+        self.write('build/notes.txt', 'kept\n')
+        self.assertNotEqual(self.digest(), digest)
+
+    def test_dockerfile_always_counts(self):
+        self.write('.dockerignore', 'Dockerfile\n')
+        digest = self.digest()
+        self.write('Dockerfile', 'FROM other\n')
+        self.assertNotEqual(self.digest(), digest)
+
+
+class TestIndex(unittest.TestCase):
+
+    def test_record_and_lookup(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with mock.patch.dict(os.environ, {'GALLEY_CACHE_DIR': directory}):
+            self.assertEqual(buildcache.lookup('abc'), None)
+            buildcache.record('abc', '123')
+            self.assertEqual(buildcache.lookup('abc'), '123')
+
+
+if __name__ == '__main__':
+    unittest.main()
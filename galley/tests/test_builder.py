@@ -0,0 +1,110 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+from galley import builder
+
+# The stand-in daemon the benchmarks run against.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir,
+                                os.pardir, 'benchmarks'))
+import fakedaemon  # noqa
+
+RESOURCE = {'name': 'redis', 'image': 'abc', 'command': ['redis-server'],
+            'cont_port': 6379, 'host_port': '{{random_port}}',
+            'mem_limit': '256m', 'warmup': 0}
+
+
+class TestResourceFingerprint(unittest.TestCase):
+
+    def test_stable(self):
+        self.assertEqual(builder.resource_fingerprint(dict(RESOURCE)),
+                         builder.resource_fingerprint(dict(RESOURCE)))
+
+    def test_every_container_option_counts(self):
+        resource = dict(RESOURCE, cont_volume='/data')
+        fingerprint = builder.resource_fingerprint(resource)
+        for key, value in [('image', 'def'), ('command', ['sh']),
+                           ('entrypoint', ['sh']),
+                           ('environment', {'A': 'b'}),
+                           ('hostname', 'cache'), ('working_dir', '/srv'),
+                           ('mem_limit', '1g'), ('cpu_shares', 512),
+                           ('cont_port', 6380), ('host_port', 7000),
+                           ('host_port', '{{auto_port}}'),
+                           ('host_volume', '/srv')]:
+            self.assertNotEqual(builder.resource_fingerprint(
+                dict(resource, **{key: value})), fingerprint, key)
+
+    def test_equivalent_sizes_match(self):
+        self.assertEqual(
+            builder.resource_fingerprint(RESOURCE),
+            builder.resource_fingerprint(dict(RESOURCE,
+                                              mem_limit=256 * 1024 ** 2)))
+
+
+class TestUp(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Galley keeps one client pool per daemon for the whole process,
+        # so every test talks to the same stand-in daemon.
+        cls.directory = tempfile.mkdtemp()
+        path = os.path.join(cls.directory, 'docker.sock')
+        cls.server = fakedaemon.serve(path)
+        # Streams cut off by the client are not errors here.
+        cls.server.handle_error = lambda request, address: None
+        cls.environ = mock.patch.dict(os.environ, {
+            'DOCKER_HOST': 'unix://' + path,
+            'GALLEY_PORT_LEASES': os.path.join(cls.directory, 'leases'),
+        })
+        cls.environ.start()
+        builder.DEFAULT_DAEMON.state.loaded = False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.environ.stop()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.state_path = os.path.join(self.directory, self.id() + '.json')
+        self.config = {
+            'images': {0: {'name': 'base', 'source': 'bench/base',
+                           'tag': '1', 'action': 'pull'}},
+            'resources': {0: dict(RESOURCE, image='{{base}}')},
+        }
+
+    def up(self):
+        environment = builder.up(copy.deepcopy(self.config),
+                                 state_path=self.state_path)
+        return environment['resources'][0]['container']
+
+    def test_unchanged_container_is_reused(self):
+        self.assertEqual(self.up(), self.up())
+
+    def test_changed_mem_limit_replaces_container(self):
+        first = self.up()
+        self.config['resources'][0]['mem_limit'] = '1g'
+        self.assertNotEqual(self.up(), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import unittest
+
+from galley import buildlog
+
+
+def stream(*messages):
+    return ''.join(json.dumps(msg) + '\r\n' for msg in messages)
+
+
+class TestBuildLog(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.log = buildlog.BuildLog(
+            on_event=lambda event, text: self.events.append((event, text)))
+
+    def test_finds_built_image(self):
+        data = stream({'stream': 'Step 0 : FROM base\n'},
+                      {'stream': ' ---> 123abc\n'},
+                      {'stream': 'Successfully built 4567def\n'})
+        for i in range(0, len(data), 5):
+            self.log.feed(data[i:i + 5])
+        self.assertEqual(self.log.image, '4567def')
+        self.assertEqual(self.log.error, None)
+        self.assertEqual(self.events, [('step', 'Step 0 : FROM base'),
+                                       ('output', ' ---> 123abc'),
+                                       ('output',
+                                        'Successfully built 4567def')])
+
+    def test_error(self):
+        self.log.feed(stream({'stream': 'Step 1 : RUN false\n'},
+                             {'error': 'returned a non-zero code: 1',
+                              'errorDetail': {'code': 1}}))
+        self.assertEqual(self.log.image, None)
+        self.assertEqual(self.log.error, 'returned a non-zero code: 1')
+        self.assertEqual(self.log.tail(), 'Step 1 : RUN false\n'
+                                          'ERROR: returned a non-zero code: 1')
+        self.assertEqual(self.events[-1],
+                         ('error', 'returned a non-zero code: 1'))
+
+    def test_undecodable_line_is_kept_as_output(self):
+        self.log.feed('plain text\n' + stream({'stream': 'after\n'}))
+        self.assertEqual(self.log.tail(), 'plain text\nafter')
+
+    def test_keeps_last_lines(self):
+        log = buildlog.BuildLog(max_lines=2)
+        log.feed(stream({'stream': 'a\nb\nc\n'}))
+        self.assertEqual(log.tail(), 'b\nc')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import yaml
+
+from galley import configfile
+
+CONFIG = {
+    'images': {0: {'name': 'redis', 'source': 'redis', 'tag': '2.8',
+                   'action': 'pull'}},
+    'resources': {
+        0: {'name': 'cache', 'image': '{{redis}}', 'cont_port': 6379,
+            'host_port': '{{random_port}}'},
+        1: {'name': 'app', 'image': '{{redis}}',
+            'hostname': "{{environ['GALLEY_TEST_HOST']}}",
+            'environment': {
+                'URL': "redis://{{host['ip']}}:"
+                       "{{resources['cache']['host_port']}}",
+                'ID': "{{resources[0]['container']}}"}},
+    },
+    'testparams': {'host': "{{environ['GALLEY_TEST_HOST']}}"},
+}
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.config = copy.deepcopy(CONFIG)
+        patcher = mock.patch.dict(os.environ,
+                                  {'GALLEY_TEST_HOST': 'example'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertInvalid(self, message):
+        try:
+            configfile.validate(self.config)
+        except Exception as exc:
+            self.assertIn(message, str(exc))
+        else:
+            self.fail("Invalid config was accepted")
+
+    def test_valid(self):
+        resolved = configfile.validate(self.config)
+        self.assertEqual(resolved['testparams'], {'host': 'example'})
+        self.assertEqual(resolved['resources'][1]['hostname'], 'example')
+        # Runtime values are left for build_environment.
+        self.assertEqual(resolved['resources'][0]['host_port'],
+                         '{{random_port}}')
+        self.assertEqual(self.config, CONFIG)
+
+    def test_not_a_mapping(self):
+        self.config = []
+        self.assertInvalid('must be a mapping')
+        self.config = {'resources': [{'image': 'redis'}]}
+        self.assertInvalid('The resources section must be a mapping')
+
+    def test_duplicate_image_name(self):
+        self.config['images'][1] = dict(self.config['images'][0])
+        self.assertInvalid('more than one image is named redis')
+
+    def test_unknown_image(self):
+        self.config['resources'][0]['image'] = '{{mongo}}'
+        self.assertInvalid('resources.0.image: unknown reference {{mongo}}')
+
+    def test_unknown_reference(self):
+        self.config['resources'][1]['environment']['X'] = '{{nope}}'
+        self.assertInvalid(
+            'resources.1.environment: unknown reference {{nope}}')
+
+    def test_missing_key_names_path(self):
+        self.config['resources'][1]['environment']['X'] = \
+            "{{resources[0]['port']}}"
+        self.assertInvalid('resources.1.environment.X')
+
+    def test_missing_environment_variable(self):
+        del os.environ['GALLEY_TEST_HOST']
+        self.assertInvalid('testparams.host')
+
+    def test_cycle(self):
+        self.config['resources'][0]['depends_on'] = ['app']
+        self.assertInvalid('cycle')
+
+    def test_bad_resource(self):
+        self.config['resources'][0]['mem_limit'] = 'lots'
+        self.assertInvalid('Resource 0')
+
+    def test_daemon_without_url(self):
+        self.config['daemons'] = {0: {'url': 'tcp://a:2375'},
+                                  1: {'memory': '4g'}}
+        self.assertInvalid('Daemon 1 has no url')
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.dict(os.environ,
+                                  {'GALLEY_CACHE_DIR': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cached(self):
+        return os.listdir(os.path.join(self.directory, 'configs'))
+
+    def test_second_load_is_cached(self):
+        text = 'images:\n  0: {name: redis, source: redis}\n'
+        config = configfile.load(text)
+        self.assertEqual(config, {'images': {0: {'name': 'redis',
+                                                 'source': 'redis'}}})
+        with mock.patch.object(configfile, 'parse',
+                               side_effect=AssertionError('parsed')):
+            self.assertEqual(configfile.load(text), config)
+        self.assertEqual(len(self.cached()), 1)
+
+    def test_changed_text_is_parsed(self):
+        self.assertEqual(configfile.load('a: 1'), {'a': 1})
+        self.assertEqual(configfile.load('a: 2'), {'a': 2})
+
+    def test_corrupt_cache_entry_is_replaced(self):
+        configfile.load('a: 1')
+        path = os.path.join(self.directory, 'configs', self.cached()[0])
+        with open(path, 'w') as outfile:
+            outfile.write('garbage')
+        self.assertEqual(configfile.load('a: 1'), {'a': 1})
+        self.assertEqual(configfile.load('a: 1'), {'a': 1})
+
+    def test_cache_is_bounded(self):
+        with mock.patch.object(configfile, 'MAX_CACHED', 2):
+            for n in range(4):
+                configfile.load('a: %d' % n)
+        self.assertEqual(len(self.cached()), 2)
+
+    def test_unwritable_cache(self):
+        cache_file = os.path.join(self.directory, 'file')
+        open(cache_file, 'w').close()
+        os.environ['GALLEY_CACHE_DIR'] = cache_file
+        self.assertEqual(configfile.load('a: 1'), {'a': 1})
+
+    def test_safe_loader(self):
+        self.assertRaises(yaml.YAMLError, configfile.parse,
+                          '!!python/object/apply:os.getcwd []')
+
+
+if __name__ == '__main__':
+    unittest.main()
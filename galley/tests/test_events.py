@@ -0,0 +1,73 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import StringIO
+import unittest
+
+from galley import events
+from galley import state
+
+CONTAINER = 'c' * 64
+
+
+def chunked(*chunks):
+    return ''.join('%x\r\n%s\r\n' % (len(chunk), chunk)
+                   for chunk in chunks) + '0\r\n\r\n'
+
+
+class TestChunks(unittest.TestCase):
+
+    def test_reads_chunks(self):
+        body = StringIO.StringIO(chunked('{"a":', ' 1}\n', 'x' * 300))
+        self.assertEqual(list(events._chunks(body)),
+                         ['{"a":', ' 1}\n', 'x' * 300])
+
+    def test_chunk_extensions_and_end_of_stream(self):
+        body = StringIO.StringIO('4;name=value\r\nabcd\r\n')
+        self.assertEqual(list(events._chunks(body)), ['abcd'])
+
+    def test_decode_messages_split_across_chunks(self):
+        data = json.dumps({'status': 'start', 'id': CONTAINER})
+        body = StringIO.StringIO(chunked(data[:10], data[10:]))
+        self.assertEqual(list(events.decode(events._chunks(body))),
+                         [{'status': 'start', 'id': CONTAINER}])
+
+
+class TestApply(unittest.TestCase):
+
+    def setUp(self):
+        self.state = state.DaemonState()
+        self.state.load([], [])
+
+    def test_lifecycle(self):
+        events.apply(self.state, {'status': 'create', 'id': CONTAINER})
+        self.assertTrue(self.state.find_container(CONTAINER))
+        self.assertFalse(self.state.is_running(CONTAINER))
+        events.apply(self.state, {'status': 'start', 'id': CONTAINER})
+        self.assertTrue(self.state.is_running(CONTAINER))
+        events.apply(self.state, {'status': 'die', 'id': CONTAINER})
+        self.assertFalse(self.state.is_running(CONTAINER))
+        events.apply(self.state, {'status': 'restart', 'id': CONTAINER})
+        self.assertTrue(self.state.is_running(CONTAINER))
+        events.apply(self.state, {'status': 'destroy', 'id': CONTAINER})
+        self.assertEqual(self.state.find_container(CONTAINER), None)
+
+    def test_ignores_other_events(self):
+        events.apply(self.state, {'status': 'pull', 'id': 'redis:latest'})
+        events.apply(self.state, {'status': 'start'})
+        self.assertEqual(self.state.find_container('redis:latest'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import unittest
+
+from galley import jsonstream
+
+
+class TestDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.invalid = []
+        self.decoder = jsonstream.Decoder(on_invalid=self.invalid.append)
+
+    def feed(self, *chunks):
+        messages = []
+        for chunk in chunks:
+            messages.extend(self.decoder.feed(chunk))
+        return messages
+
+    def test_several_messages_in_one_chunk(self):
+        self.assertEqual(self.feed('{"a": 1}\n{"b": 2}\r\n{"c": 3}'),
+                         [{'a': 1}, {'b': 2}, {'c': 3}])
+
+    def test_message_split_across_chunks(self):
+        data = json.dumps({'stream': 'Step 1 : FROM base\n'}) + '\n'
+        for size in (1, 2, 7):
+            self.setUp()
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(self.feed(*chunks),
+                             [{'stream': 'Step 1 : FROM base\n'}])
+
+    def test_nothing_yielded_until_complete(self):
+        self.assertEqual(self.feed('{"a": [1, 2'), [])
+        self.assertEqual(self.feed(']}\n'), [{'a': [1, 2]}])
+
+    def test_bad_line_is_skipped(self):
+        self.assertEqual(self.feed('not json\n{"a": 1}\n'), [{'a': 1}])
+        self.assertEqual(self.invalid, ['not json\n'])
+
+    def test_bad_line_split_across_chunks(self):
+        self.assertEqual(self.feed('{"a": 1}\nnot ', 'json\n{"b"', ': 2}'),
+                         [{'a': 1}, {'b': 2}])
+        self.assertEqual(self.invalid, ['not json\n'])
+
+    def test_bad_text_without_line_break_is_bounded(self):
+        self.assertEqual(self.feed('x' * jsonstream.MAX_PENDING), [])
+        self.assertEqual(self.invalid, [])
+        self.assertEqual(self.feed('x{"a": 1}'), [])
+        self.assertEqual(len(self.invalid), 1)
+        self.assertEqual(self.feed('\n{"b": 2}'), [{'b': 2}])
+
+    def test_without_on_invalid(self):
+        decoder = jsonstream.Decoder()
+        self.assertEqual(list(decoder.feed('oops\n{"a": 1}')), [{'a': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import unittest
+
+from galley import logcapture
+
+
+def frame(stream, data):
+    return logcapture.HEADER.pack(stream, len(data)) + data
+
+
+class TestDemultiplexer(unittest.TestCase):
+
+    def setUp(self):
+        self.written = []
+        self.demux = logcapture.Demultiplexer(
+            lambda stream, data: self.written.append((stream, data)))
+
+    def test_whole_frames(self):
+        self.demux.feed(frame(1, 'out\n') + frame(2, 'err\n'))
+        self.assertEqual(self.written, [('stdout', 'out\n'),
+                                        ('stderr', 'err\n')])
+
+    def test_frames_split_across_reads(self):
+        data = frame(1, 'hello\n') + frame(2, 'world\n')
+        # Split inside the first header, the first body and the second
+        # header.
+        for chunk in (data[:3], data[3:10], data[10:16], data[16:]):
+            self.demux.feed(chunk)
+        self.assertEqual(self.written, [('stdout', 'hello\n'),
+                                        ('stderr', 'world\n')])
+
+    def test_byte_at_a_time(self):
+        data = frame(1, 'a') + frame(1, '') + frame(2, 'bc')
+        for i in range(len(data)):
+            self.demux.feed(data[i])
+        self.assertEqual(self.written, [('stdout', 'a'), ('stdout', ''),
+                                        ('stderr', 'bc')])
+
+
+class TestLogBuffer(unittest.TestCase):
+
+    def test_lines_split_across_writes(self):
+        log = logcapture.LogBuffer()
+        log.write('stdout', 'one\ntw')
+        log.write('stderr', 'oops\n')
+        log.write('stdout', 'o\nthr')
+        self.assertEqual(log.tail(), [('stdout', 'one'), ('stderr', 'oops'),
+                                      ('stdout', 'two'), ('stdout', 'thr')])
+
+    def test_keeps_latest(self):
+        log = logcapture.LogBuffer(max_lines=2)
+        log.write('stdout', 'a\nb\nc\n')
+        self.assertEqual(log.tail(), [('stdout', 'b'), ('stdout', 'c')])
+        self.assertEqual(log.tail(1), [('stdout', 'c')])
+        self.assertEqual(log.tail(0), [])
+
+    def test_long_lines_are_cut(self):
+        log = logcapture.LogBuffer()
+        log.write('stdout', 'x' * (logcapture.MAX_LINE_LENGTH * 2) + '\n')
+        self.assertEqual(len(log.tail()[0][1]), logcapture.MAX_LINE_LENGTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import json
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import mock
+
+from galley import ports
+
+
+class TestPorts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.lease_file = os.path.join(self.directory, 'leases.json')
+        patcher = mock.patch.dict(os.environ,
+                                  {'GALLEY_PORT_LEASES': self.lease_file})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def leases(self):
+        with open(self.lease_file) as infile:
+            return json.load(infile)
+
+    def test_allocate_leases_distinct_ports(self):
+        allocated = [ports.allocate() for n in range(5)]
+        self.assertEqual(len(set(allocated)), 5)
+        self.assertEqual(sorted(int(p) for p in self.leases()),
+                         sorted(allocated))
+        self.assertEqual(set(self.leases().values()), set([os.getpid()]))
+
+    def test_skips_leased_ports(self):
+        with mock.patch.object(ports, '_free_port',
+                               side_effect=[5000, 5000, 5001]):
+            self.assertEqual(ports.allocate(), 5000)
+            self.assertEqual(ports.allocate(), 5001)
+
+    def test_gives_up(self):
+        ports.allocate()
+        with mock.patch.object(ports, '_free_port',
+                               return_value=int(list(self.leases())[0])):
+            self.assertRaises(Exception, ports.allocate, retries=3)
+
+    def test_release_only_given_ports(self):
+        first, second = ports.allocate(), ports.allocate()
+        ports.release([first])
+        self.assertEqual(list(self.leases()), [str(second)])
+        ports.release()
+        self.assertEqual(self.leases(), {})
+
+    def test_drops_leases_of_exited_processes(self):
+        with open(self.lease_file, 'w') as outfile:
+            json.dump({'5000': 2 ** 22 + 1}, outfile)
+        with mock.patch.object(ports, '_alive', return_value=False):
+            ports.allocate()
+        self.assertNotIn('5000', self.leases())
+
+    def test_files_are_shared(self):
+        umask = os.umask(0o077)
+        try:
+            ports.allocate()
+        finally:
+            os.umask(umask)
+        for path in (self.lease_file, self.lease_file + '.lock'):
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o666)
+
+    def test_default_directory_is_shared(self):
+        directory = os.path.join(self.directory, 'galley-ports')
+        with mock.patch.object(ports, 'LEASE_DIR', directory):
+            with mock.patch.dict(os.environ):
+                del os.environ['GALLEY_PORT_LEASES']
+                ports.allocate()
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o777)
+        self.assertTrue(os.path.exists(os.path.join(directory,
+                                                    'leases.json')))
+
+    def test_unlockable(self):
+        os.environ['GALLEY_PORT_LEASES'] = os.path.join(
+            self.lease_file, 'leases.json')
+        open(self.lease_file, 'w').close()
+        try:
+            ports.allocate()
+        except Exception as exc:
+            self.assertIn('GALLEY_PORT_LEASES', str(exc))
+        else:
+            self.fail("Lease file in a file was accepted")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import BaseHTTPServer
+import socket
+import threading
+import unittest
+
+from galley import probes
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200 if self.path == '/ok' else 503)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPoll(unittest.TestCase):
+
+    def test_retries_until_true(self):
+        results = iter([False, None, True])
+        self.assertTrue(probes.poll(lambda: next(results), timeout=5,
+                                    interval=0.001) is not None)
+
+    def test_exceptions_are_failed_attempts(self):
+        attempts = []
+
+        def check():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise socket.error('refused')
+            return True
+
+        self.assertTrue(probes.poll(check, timeout=5,
+                                    interval=0.001) is not None)
+        self.assertEqual(len(attempts), 3)
+
+    def test_gives_up_at_deadline(self):
+        self.assertEqual(probes.poll(lambda: False, timeout=0.05,
+                                     interval=0.01), None)
+
+
+class TestProbes(unittest.TestCase):
+
+    def test_tcp(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        port = server.getsockname()[1]
+        self.assertTrue(probes.tcp('127.0.0.1', str(port)))
+        server.close()
+        self.assertRaises(socket.error, probes.tcp, '127.0.0.1', port)
+
+    def test_http(self):
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+        self.assertTrue(probes.http(url + '/ok'))
+        self.assertRaises(Exception, probes.http, url + '/starting')
+
+    def test_log(self):
+        logs = lambda: 'starting\nReady to accept connections\n'
+        self.assertTrue(probes.log(logs, '^Ready to accept'))
+        self.assertFalse(probes.log(logs, '^accept'))
+
+    def test_command(self):
+        self.assertTrue(probes.command(['true']))
+        self.assertFalse(probes.command(['false']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import unittest
+
+import galley
+from galley import runner
+
+PARENT = os.getpid()
+
+
+# Sample test classes for run_parallel; nose skips them.
+class Sample(unittest.TestCase):
+    __test__ = False
+    shard = None
+
+    def test_environment(self):
+        self.assertNotEqual(os.getpid(), PARENT)
+        if self.shard is not None:
+            self.assertEqual(galley.get_environment()['shard'], self.shard)
+
+
+class SampleA(Sample):
+    shard = 0
+
+
+class SampleB(Sample):
+    shard = 1
+
+
+class SampleC(Sample):
+    shard = 0
+
+
+class SampleFailing(Sample):
+
+    def test_fails(self):
+        self.fail('expected')
+
+
+class SampleSerial(unittest.TestCase):
+    __test__ = False
+    serial = True
+
+    def test_in_parent(self):
+        self.assertEqual(os.getpid(), PARENT)
+
+
+def suite(*classes):
+    loader = unittest.TestLoader()
+    return unittest.TestSuite(loader.loadTestsFromTestCase(cls)
+                              for cls in classes)
+
+
+class TestRunner(unittest.TestCase):
+
+    def test_test_classes(self):
+        self.assertEqual(runner.test_classes(suite(SampleA, SampleB,
+                                                   SampleA)),
+                         [SampleA, SampleB])
+        self.assertEqual(runner.class_name(SampleA),
+                         'galley.tests.test_runner.SampleA')
+        self.assertTrue(runner.is_serial(SampleSerial))
+        self.assertFalse(runner.is_serial(SampleA))
+
+    def test_classes_run_in_workers(self):
+        results = runner.run_parallel(
+            suite(Sample, SampleSerial), [{'shard': 0}], workers=2)
+        self.assertEqual(results.failures, [])
+        self.assertEqual(results.errors, [])
+        self.assertEqual(results.testsRun, 2)
+
+    def test_shards_are_partitioned_in_order(self):
+        results = runner.run_parallel(
+            suite(SampleA, SampleB, SampleC, SampleSerial),
+            [{'shard': 0}, {'shard': 1}])
+        self.assertEqual(results.failures, [])
+        self.assertEqual(results.errors, [])
+        self.assertEqual(results.testsRun, 4)
+
+    def test_failures_are_merged(self):
+        results = runner.run_parallel(suite(Sample, SampleFailing),
+                                      [{'shard': 0}], workers=2)
+        self.assertEqual(results.testsRun, 3)
+        self.assertEqual(len(results.failures), 1)
+        self.assertIn('SampleFailing', results.failures[0][0])
+        self.assertFalse(results.wasSuccessful())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import threading
+import unittest
+
+from galley import scheduler
+
+
+class TestResourceDependencies(unittest.TestCase):
+
+    def test_references_and_depends_on(self):
+        resources = {
+            0: {'name': 'redis'},
+            1: {'name': 'mongo', 'depends_on': 'redis'},
+            2: {'name': 'app',
+                'environment': {'A': "{{resources[0]['host_port']}}",
+                                'B': "{{resources['mongo']['host_port']}}"}},
+        }
+        self.assertEqual(scheduler.resource_dependencies(resources),
+                         {0: set(), 1: set([0]), 2: set([0, 1])})
+
+    def test_unknown_reference(self):
+        resources = {0: {'name': 'app', 'depends_on': ['nope']}}
+        self.assertRaises(Exception, scheduler.resource_dependencies,
+                          resources)
+
+
+class TestCheckGraph(unittest.TestCase):
+
+    def test_acyclic(self):
+        scheduler.check_graph({'a': set(), 'b': set(['a']),
+                               'c': set(['a', 'b'])})
+
+    def test_cycle(self):
+        try:
+            scheduler.check_graph({'a': set(['c']), 'b': set(['a']),
+                                   'c': set(['b']), 'd': set()})
+        except Exception as exc:
+            self.assertIn('cycle', str(exc))
+            self.assertIn('a, b, c', str(exc))
+        else:
+            self.fail("Cycle not detected")
+
+    def test_unknown_node(self):
+        self.assertRaises(Exception, scheduler.check_graph,
+                          {'a': set(['missing'])})
+
+
+class TestRunGraph(unittest.TestCase):
+
+    def test_runs_after_dependencies(self):
+        order = []
+        lock = threading.Lock()
+
+        def func(node):
+            with lock:
+                order.append(node)
+            return node.upper()
+
+        results, errors = scheduler.run_graph(
+            {'a': set(), 'b': set(['a']), 'c': set(['b']), 'd': set()},
+            func)
+        self.assertEqual(errors, {})
+        self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'})
+        self.assertTrue(order.index('a') < order.index('b') <
+                        order.index('c'))
+
+    def test_skips_dependents_of_failure(self):
+        ran = []
+
+        def func(node):
+            ran.append(node)
+            if node == 'a':
+                raise ValueError('boom')
+
+        results, errors = scheduler.run_graph(
+            {'a': set(), 'b': set(['a']), 'c': set(['b']), 'd': set()},
+            func, max_workers=1, stop_on_error=False)
+        self.assertEqual(list(errors), ['a'])
+        self.assertTrue(isinstance(errors['a'], ValueError))
+        self.assertEqual(sorted(ran), ['a', 'd'])
+        self.assertEqual(list(results), ['d'])
+
+    def test_stop_on_error_starts_nothing_new(self):
+        ran = []
+
+        def func(node):
+            ran.append(node)
+            if node == 'a':
+                raise ValueError('boom')
+
+        graph = {'a': set(), 'b': set(), 'c': set(['b'])}
+        scheduler.run_graph(graph, func, max_workers=1)
+        self.assertEqual(ran, ['a', 'b'])
+        del ran[:]
+        scheduler.run_graph(graph, func, max_workers=1, stop_on_error=False)
+        self.assertEqual(ran, ['a', 'b', 'c'])
+
+    def test_limits(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def func(node):
+            with lock:
+                running.append(node)
+                peak.append(len(running))
+            release.wait(0.05)
+            with lock:
+                running.remove(node)
+
+        graph = dict((n, set()) for n in range(6))
+        scheduler.run_graph(graph, func, max_workers=6,
+                            kind=lambda node: 'pull', limits={'pull': 2})
+        self.assertEqual(max(peak), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
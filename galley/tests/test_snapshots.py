@@ -0,0 +1,94 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from galley import snapshots
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.dict(os.environ,
+                                  {'GALLEY_CACHE_DIR': self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = 1000.0
+        patcher = mock.patch('time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def touch(self, image, daemon=None, size=None):
+        self.now += 1
+        snapshots.touch(image, daemon, size)
+
+    def test_repository(self):
+        self.assertEqual(snapshots.repository('My DB'),
+                         'galley-snapshot/my_db')
+
+    def test_snapshot_key(self):
+        seed_file = os.path.join(self.directory, 'seed.sql')
+        with open(seed_file, 'w') as outfile:
+            outfile.write('insert 1;')
+        key = snapshots.snapshot_key('abc', 'load', [seed_file])
+        self.assertEqual(key, snapshots.snapshot_key('abc', 'load',
+                                                     [seed_file]))
+        self.assertNotEqual(key, snapshots.snapshot_key('abd', 'load',
+                                                        [seed_file]))
+        self.assertNotEqual(key, snapshots.snapshot_key('abc', 'reload',
+                                                        [seed_file]))
+        with open(seed_file, 'w') as outfile:
+            outfile.write('insert 2;')
+        self.assertNotEqual(key, snapshots.snapshot_key('abc', 'load',
+                                                        [seed_file]))
+
+    def test_evicts_least_recently_used_first(self):
+        self.touch('a:1', size=100)
+        self.touch('b:1', 'tcp://other:2375', size=100)
+        self.touch('c:1', size=100)
+        self.assertEqual(snapshots.evictable(300), [])
+        self.assertEqual(snapshots.evictable(250), [('a:1', None)])
+        self.assertEqual(snapshots.evictable(150),
+                         [('a:1', None), ('b:1', 'tcp://other:2375')])
+
+    def test_use_refreshes(self):
+        self.touch('a:1', size=100)
+        self.touch('b:1', size=100)
+        self.touch('a:1')
+        self.assertEqual(snapshots.evictable(150), [('b:1', None)])
+
+    def test_kept_snapshots_are_skipped(self):
+        self.touch('a:1', size=100)
+        self.touch('b:1', size=100)
+        self.touch('c:1', size=100)
+        self.assertEqual(snapshots.evictable(150, keep=[('a:1', None)]),
+                         [('b:1', None), ('c:1', None)])
+
+    def test_same_image_on_two_daemons(self):
+        self.touch('a:1', 'tcp://one:2375', size=100)
+        self.touch('a:1', 'tcp://two:2375', size=100)
+        self.assertEqual(snapshots.evictable(100),
+                         [('a:1', 'tcp://one:2375')])
+        snapshots.forget('a:1', 'tcp://one:2375')
+        self.assertEqual(snapshots.evictable(100), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
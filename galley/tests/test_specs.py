@@ -0,0 +1,99 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import unittest
+
+from galley import specs
+
+
+class TestParseSize(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(specs.parse_size('512'), 512)
+        self.assertEqual(specs.parse_size('2k'), 2048)
+        self.assertEqual(specs.parse_size('512m'), 512 * 1024 ** 2)
+        self.assertEqual(specs.parse_size('1.5GB'), 3 * 1024 ** 3 // 2)
+        self.assertEqual(specs.parse_size(100), 100)
+        self.assertEqual(specs.parse_size(None), None)
+
+    def test_invalid(self):
+        self.assertRaises(Exception, specs.parse_size, 'lots')
+
+
+class TestValidate(unittest.TestCase):
+
+    def assertInvalid(self, data, message):
+        try:
+            specs.validate(3, data)
+        except Exception as exc:
+            self.assertTrue(str(exc).startswith('Resource 3'), str(exc))
+            self.assertIn(message, str(exc))
+        else:
+            self.fail("%r was accepted" % data)
+
+    def test_valid(self):
+        specs.validate(0, {'image': '{{redis}}',
+                           'host_port': '{{random_port}}',
+                           'cont_port': '6379/tcp', 'mem_limit': '256m',
+                           'cpu_shares': 512, 'command': ['run'],
+                           'environment': {'A': 'b'}})
+
+    def test_invalid(self):
+        self.assertInvalid([], 'must be a mapping')
+        self.assertInvalid({'name': 'x'}, 'has no image')
+        self.assertInvalid({'image': 'x', 'cont_port': 'http'}, 'cont_port')
+        self.assertInvalid({'image': 'x', 'host_port': 80},
+                           'has a host_port but no cont_port')
+        self.assertInvalid({'image': 'x', 'mem_limit': 'big'}, 'mem_limit')
+        self.assertInvalid({'image': 'x', 'cpu_shares': 'half'},
+                           'cpu_shares')
+        self.assertInvalid({'image': 'x', 'environment': 'A=b'},
+                           'environment')
+        self.assertInvalid({'image': 'x', 'command': 3}, 'command')
+
+    def test_templates_checked_later(self):
+        specs.validate(0, {'image': 'x', 'cont_port': 80,
+                           'host_port': "{{environ['PORT']}}",
+                           'mem_limit': "{{environ['MEM']}}"})
+
+
+class TestPullPolicy(unittest.TestCase):
+
+    def test_defaults(self):
+        self.assertEqual(specs.pull_policy({}), 'always')
+        self.assertEqual(specs.pull_policy({'tag': 'latest'}), 'always')
+        self.assertEqual(specs.pull_policy({'tag': '2.8'}), 'if-not-present')
+        self.assertEqual(specs.pull_policy({'tag': '2.8',
+                                            'pull_policy': 'always'}),
+                         'always')
+
+
+class TestContainerSpec(unittest.TestCase):
+
+    def test_from_resource(self):
+        spec = specs.ContainerSpec.from_resource(
+            {'image': 'abc', 'cont_port': 80, 'host_port': '{{auto_port}}',
+             'host_volume': '/srv', 'cont_volume': '/data',
+             'mem_limit': '1k', 'cpu_shares': '2'}, name='galley-x')
+        self.assertEqual(spec.port_bindings, {80: None})
+        self.assertEqual(spec.binds, {'/srv': '/data'})
+        options = spec.create_options()
+        self.assertEqual(options['name'], 'galley-x')
+        self.assertEqual(options['ports'], [80])
+        self.assertEqual(options['volumes'], ['/data'])
+        self.assertEqual(options['mem_limit'], 1024)
+        self.assertEqual(options['cpu_shares'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import threading
+import unittest
+
+from galley import state
+
+IMAGE = 'a' * 64
+CONTAINER = 'c' * 64
+
+
+class TestDaemonState(unittest.TestCase):
+
+    def setUp(self):
+        self.state = state.DaemonState()
+        self.state.load(
+            [{'Id': IMAGE, 'RepoTags': ['redis:latest']}],
+            [{'Id': CONTAINER, 'Names': ['/redis'], 'Status': 'Up 2 sec'}])
+
+    def test_find_image(self):
+        for ref in (IMAGE, IMAGE[:12], 'redis:latest'):
+            self.assertEqual(self.state.find_image(ref)['Id'], IMAGE)
+        self.assertEqual(self.state.find_image('redis', 'latest')['Id'],
+                         IMAGE)
+        self.assertEqual(self.state.find_image('redis', '2.8'), None)
+
+    def test_remove_image_by_tag(self):
+        self.state.remove_image('redis:latest')
+        self.assertEqual(self.state.find_image(IMAGE), None)
+        self.assertEqual(self.state.find_image(IMAGE[:12]), None)
+
+    def test_find_container(self):
+        for ref in (CONTAINER, CONTAINER[:12], 'redis', '/redis'):
+            self.assertEqual(self.state.find_container(ref)['Id'], CONTAINER)
+        self.assertTrue(self.state.is_running('redis'))
+
+    def test_short_id_added_later_is_merged(self):
+        cont = self.state.add_container(CONTAINER[:12], ['/cache'])
+        self.assertEqual(cont['Id'], CONTAINER)
+        self.assertEqual(self.state.find_container('cache')['Id'], CONTAINER)
+
+    def test_remove_container(self):
+        self.state.remove_container('redis')
+        for ref in (CONTAINER, CONTAINER[:12], 'redis'):
+            self.assertEqual(self.state.find_container(ref), None)
+        self.assertFalse(self.state.is_running(CONTAINER))
+
+    def test_wait_wakes_on_change(self):
+        timer = threading.Timer(
+            0.05, self.state.set_running, (CONTAINER, False))
+        timer.start()
+        self.assertTrue(self.state.wait(
+            lambda: not self.state.is_running(CONTAINER), timeout=5))
+        timer.join()
+
+    def test_wait_times_out(self):
+        self.assertFalse(self.state.wait(
+            lambda: not self.state.is_running(CONTAINER), timeout=0.05))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from galley import statefile
+
+
+class TestStateFile(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'state.json')
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(statefile.StateFile(self.path).keys(), [])
+
+    def test_changes_are_saved_at_once(self):
+        state = statefile.StateFile(self.path)
+        state.set('redis', 'c' * 64, 'abc')
+        state.set('mongo', 'd' * 64, 'def', daemon='tcp://other:2375')
+        reloaded = statefile.StateFile(self.path)
+        self.assertEqual(sorted(reloaded.keys()), ['mongo', 'redis'])
+        self.assertEqual(reloaded.get('mongo'),
+                         {'container': 'd' * 64, 'fingerprint': 'def',
+                          'daemon': 'tcp://other:2375'})
+        state.remove('redis')
+        state.remove('missing')
+        self.assertEqual(statefile.StateFile(self.path).keys(), ['mongo'])
+
+    def test_corrupt_file_is_empty(self):
+        with open(self.path, 'w') as outfile:
+            outfile.write('{"resources": ')
+        self.assertEqual(statefile.StateFile(self.path).get('redis'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
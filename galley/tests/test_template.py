@@ -0,0 +1,115 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import unittest
+
+from galley import template
+
+
+class TestParseReference(unittest.TestCase):
+
+    def test_root_only(self):
+        ref = template.parse_reference(' redis ')
+        self.assertEqual(ref.root, 'redis')
+        self.assertEqual(ref.keys, ())
+
+    def test_subscripts(self):
+        ref = template.parse_reference("resources[0][\"host\"]['ip']")
+        self.assertEqual(ref.root, 'resources')
+        self.assertEqual(ref.keys, (0, 'host', 'ip'))
+
+    def test_negative_index(self):
+        self.assertEqual(template.parse_reference('a[-1]').keys, (-1,))
+
+    def test_unparseable(self):
+        for source in ('', 'a[b]', "a['b'", 'a[0]x', "a['b']()"):
+            self.assertRaises(template.TemplateError,
+                              template.parse_reference, source)
+
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.context = {
+            'resources': {0: {'name': 'redis', 'host_port': 6379}},
+            'host': {'ip': '10.0.0.1'},
+            'environ': {'USER': 'galley'},
+        }
+
+    def test_interpolates(self):
+        self.assertEqual(
+            template.render("redis://{{host['ip']}}:"
+                            "{{resources[0]['host_port']}}", self.context),
+            'redis://10.0.0.1:6379')
+
+    def test_whole_reference_keeps_type(self):
+        self.assertEqual(
+            template.render("{{resources[0]['host_port']}}", self.context),
+            6379)
+
+    def test_resource_by_name_or_quoted_index(self):
+        self.assertEqual(template.render(
+            "{{resources['redis']['host_port']}}", self.context), 6379)
+        self.assertEqual(template.render(
+            "{{resources['0']['host_port']}}", self.context), 6379)
+
+    def test_unknown_roots_are_left(self):
+        self.assertEqual(template.render("{{redis}}:{{environ['USER']}}",
+                                         self.context),
+                         '{{redis}}:galley')
+
+    def test_nested_values(self):
+        value = {'environment': ["A={{environ['USER']}}", 1],
+                 'name': 'plain'}
+        self.assertEqual(template.render(value, self.context),
+                         {'environment': ['A=galley', 1], 'name': 'plain'})
+
+    def test_does_not_evaluate(self):
+        source = "{{__import__('os').getcwd()}}"
+        self.assertEqual(template.render(source, self.context), source)
+        self.assertRaises(template.TemplateError, template.render,
+                          "{{host[__import__]}}", self.context)
+
+    def test_missing_key_names_path(self):
+        value = {'environment': {'URL': "{{resources[0]['port']}}"}}
+        try:
+            template.render(value, self.context, 'resources.2')
+        except template.TemplateError as exc:
+            self.assertTrue(str(exc).startswith(
+                'resources.2.environment.URL:'), str(exc))
+            self.assertIn("'port'", str(exc))
+        else:
+            self.fail("TemplateError not raised")
+
+    def test_missing_list_item_names_path(self):
+        try:
+            template.render(['ok', "{{resources[1]['host_port']}}"],
+                            self.context, 'command')
+        except template.TemplateError as exc:
+            self.assertTrue(str(exc).startswith('command[1]:'), str(exc))
+        else:
+            self.fail("TemplateError not raised")
+
+
+class TestReferences(unittest.TestCase):
+
+    def test_finds_nested(self):
+        value = {'a': ["{{x}}", {'b': "{{resources[1]['ip']}} {{y[0]}}"}],
+                 'c': 3}
+        self.assertEqual(sorted(ref.source
+                                for ref in template.references(value)),
+                         ['resources[1][\'ip\']', 'x', 'y[0]'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import BaseHTTPServer
+import json
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import unittest
+
+from galley import builder
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        SocketServer.UnixStreamServer.__init__(self, path, Handler)
+        self.connections = 0
+
+    def get_request(self):
+        request = SocketServer.UnixStreamServer.get_request(self)
+        self.connections += 1
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request[0], ('localhost', 0)
+
+
+class TestUnixAdapter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = Server(os.path.join(self.directory, 'docker.sock'))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_reuses_one_connection(self):
+        c = builder.connect(base_url='unix://' + self.server.server_address)
+        for n in range(20):
+            self.assertEqual(c.version(), {'path': '/v1.10/version'})
+        self.assertEqual(self.server.connections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+FORMATS = ('json', 'chrome')
+
+SPANS = []
+SPANS_LOCK = threading.Lock()
+
+
+def record(name, phase, start, duration, **tags):
+    """Record a finished span."""
+    with SPANS_LOCK:
+        SPANS.append({
+            'name': str(name),
+            'phase': phase,
+            'start': start,
+            'duration': duration,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'tags': tags,
+        })
+
+
+def extend(recorded):
+    """Add spans recorded elsewhere, such as in a test worker process."""
+    with SPANS_LOCK:
+        SPANS.extend(recorded)
+
+
+@contextlib.contextmanager
+def span(name, phase, **tags):
+    """Time the enclosed block as one span of a phase.
+
+    Spans are recorded even if the block raises, tagged with the error.
+    """
+    start = time.time()
+    try:
+        yield
+    except Exception as exc:
+        tags['error'] = str(exc)
+        raise
+    finally:
+        record(name, phase, start, time.time() - start, **tags)
+
+
+def spans():
+    with SPANS_LOCK:
+        return list(SPANS)
+
+
+def chrome_trace(recorded):
+    """Convert recorded spans to Chrome's trace event format."""
+    origin = min(s['start'] for s in recorded) if recorded else 0
+    return {'traceEvents': [{
+        'name': s['name'],
+        'cat': s['phase'],
+        'ph': 'X',
+        'ts': int((s['start'] - origin) * 1e6),
+        'dur': int(s['duration'] * 1e6),
+        'pid': s['pid'],
+        'tid': s['thread'],
+        'args': s['tags'],
+    } for s in recorded]}
+
+
+def write_profile(path, fmt='json'):
+    """Write every span recorded so far to path."""
+    data = spans()
+    if fmt == 'chrome':
+        data = chrome_trace(data)
+    else:
+        data = {'spans': data}
+    with open(path, 'w') as outfile:
+        json.dump(data, outfile, indent=2, sort_keys=True)
+
+
+def print_summary():
+    """Print how long each phase took and its slowest span."""
+    phases = {}
+    for s in spans():
+        phases.setdefault(s['phase'], []).append(s)
+    if not phases:
+        return
+    print("\n%-12s %6s %10s %10s  %s" % ('Phase', 'Count', 'Total (s)',
+                                         'Max (s)', 'Slowest'))
+    for phase, members in sorted(phases.items(),
+                                 key=lambda p: min(s['start']
+                                                   for s in p[1])):
+        slowest = max(members, key=lambda s: s['duration'])
+        print("%-12s %6d %10.2f %10.2f  %s" % (
+            phase, len(members), sum(s['duration'] for s in members),
+            slowest['duration'], slowest['name']))
@@ -0,0 +1,72 @@
+#   Licensed under the Apache License, Version 2.0 (the "License"); you may
+#   not use this file except in compliance with the License. You may obtain
+#   a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#   WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#   License for the specific language governing permissions and limitations
+#   under the License.
+#
+
+import httplib
+import requests.adapters
+import socket
+
+try:
+    import requests.packages.urllib3.connectionpool as connectionpool
+except ImportError:
+    import urllib3.connectionpool as connectionpool
+
+# docker-py's own unix adapter builds a new connection pool for every
+# request, so each API call opens a new socket to the daemon. The adapter
+# below keeps one pool per client and lets urllib3 reuse its connections.
+
+
+class UnixHTTPConnection(httplib.HTTPConnection, object):
+
+    def __init__(self, socket_path, timeout=60):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class UnixHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+
+    def __init__(self, socket_path, timeout=60):
+        connectionpool.HTTPConnectionPool.__init__(self, 'localhost',
+                                                   timeout=timeout)
+        self.socket_path = socket_path
+        self.socket_timeout = timeout
+
+    def _new_conn(self):
+        return UnixHTTPConnection(self.socket_path, self.socket_timeout)
+
+
+class UnixAdapter(requests.adapters.HTTPAdapter):
+    """Sends http+unix:// requests over one reusable connection pool."""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url
+        self.pool = UnixHTTPConnectionPool(
+            base_url.replace('http+unix:/', '', 1), timeout)
+        super(UnixAdapter, self).__init__()
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def request_url(self, request, proxies):
+        # The socket path is part of the URL's "host" and path; only what
+        # follows it goes on the request line.
+        return request.url.replace(self.base_url, '', 1)
+
+    def close(self):
+        self.pool.close()
+        super(UnixAdapter, self).close()